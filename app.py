@@ -1,16 +1,50 @@
 import streamlit as st
-import sys
 import os
+import gc
 import time
+import logging
+import threading
+import json
+import functools
+import random
+from collections import Counter
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
 
-# Add the current directory to Python path for imports
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from core.model import ModelManager
 from core.cot_generator import CoTGenerator
 from core.examples import ExampleProblems
+from core.hardware import QUANTIZATION_MODES, physical_cpu_count
+from core.inference_worker import InferenceWorker
 from visualization.step_display import StepVisualizer
-from visualization.flowchart import FlowchartGenerator
+
+# transformers and Plotly are slow to import, so they load on first use rather than at startup
+if TYPE_CHECKING:
+    from core.model import ModelManager
+    from visualization.flowchart import FlowchartGenerator
+
+logger = logging.getLogger(__name__)
+
+# Session state keys and their initial values, set once per browser session
+_SESSION_DEFAULTS = {
+    "model_manager": None,
+    "cot_generator": None,
+    "model_key": None,
+    "model_loading": False,
+    "pending_request": None,
+    "last_result": None,
+    "example_responses": None,
+    "problem_input": "If a train leaves the station at 3 PM traveling at 60 mph and needs to cover 180 miles, what time will it arrive?"
+}
+
+@functools.lru_cache(maxsize=1)
+def _device_caps() -> Dict[str, object]:
+    """Probe the available accelerators once per process."""
+    import torch
+    cuda = torch.cuda.is_available()
+    return {
+        "cuda": cuda,
+        "gpu_name": torch.cuda.get_device_name(0) if cuda else None,
+        "mps": hasattr(torch.backends, 'mps') and torch.backends.mps.is_available()
+    }
 
 def check_auth_token():
     """Check if authentication token is properly configured."""
@@ -22,6 +56,211 @@ def check_auth_token():
         return False, "Token not configured"
     return True, f"Token: {token[:10]}...{token[-10:] if len(token) > 20 else '***'}"
 
+@st.cache_resource(show_spinner=False)
+def get_model_manager(model_name: str, quantization: str, num_threads: Optional[int]) -> "ModelManager":
+    """Load a model once per configuration and share it across reruns."""
+    from core.model import ModelManager
+    
+    # DRAFT_MODEL names a smaller model with the same tokenizer to enable speculative decoding,
+    # INFERENCE_BACKEND=vllm serves the model through vLLM on CUDA, CUDA_GRAPHS=1 replays decode steps as CUDA graphs
+    manager = ModelManager(model_name=model_name, quantization=quantization, num_threads=num_threads,
+                           draft_model_name=os.getenv("DRAFT_MODEL") or None,
+                           backend=os.getenv("INFERENCE_BACKEND") or None,
+                           cuda_graphs=os.getenv("CUDA_GRAPHS", "0") == "1")
+    
+    # The example problems are fixed strings, so tokenize them once up front
+    manager.warm_prompt_cache([problem['question'] for problem in ExampleProblems().get_all_problems()])
+    # Every CoT prompt opens with the same system prompt, so prefill its KV cache once
+    manager.warm_prefix_cache()
+    
+    return manager
+
+@st.cache_resource(show_spinner=False)
+def get_cot_generator(model_name: str, quantization: str, num_threads: Optional[int],
+                      max_length: int) -> CoTGenerator:
+    """Get a CoT generator bound to the shared model for this configuration."""
+    return CoTGenerator(get_model_manager(model_name, quantization, num_threads), max_length=max_length)
+
+@st.cache_resource(show_spinner=False)
+def _start_model_preload(model_name: str, quantization: str, num_threads: Optional[int]) -> Dict[str, object]:
+    """Start loading the default model configuration on a background thread, once per process."""
+    preload = {
+        "thread": None,
+        "manager": None,
+        "model_key": (model_name, quantization, num_threads),
+        "abandoned": False,
+        "lock": threading.Lock()
+    }
+    
+    def run_preload():
+        try:
+            manager = get_model_manager(model_name, quantization, num_threads)
+        except Exception as e:
+            # Initialize retries the load and reports the error in the UI
+            logger.error(f"Error preloading model: {e}")
+            return
+        
+        with preload["lock"]:
+            abandoned = preload["abandoned"]
+            if not abandoned:
+                preload["manager"] = manager
+        
+        # A session initialized a different configuration while this was loading, so nobody will use it
+        if abandoned:
+            logger.info("Discarding abandoned model preload")
+            _evict_model(preload["model_key"], manager, None)
+    
+    preload["thread"] = threading.Thread(target=run_preload, name="model-preload", daemon=True)
+    preload["thread"].start()
+    
+    return preload
+
+def _evict_model(model_key: Tuple, manager: "ModelManager", preload: Optional[Dict[str, object]]):
+    """Drop a model configuration from the shared caches and free its weights."""
+    get_model_manager.clear(*model_key)
+    # Cached generators hold the manager too, and are cheap to rebuild
+    get_cot_generator.clear()
+    if preload and model_key == preload.get("model_key"):
+        preload["manager"] = None
+    
+    # Other sessions may still hold the manager, so release its weights directly rather than waiting for the
+    # last reference to go; those sessions see the model as not ready and are asked to initialize again
+    manager.cleanup()
+    gc.collect()
+    if _device_caps()["cuda"]:
+        import torch
+        torch.cuda.empty_cache()
+
+@st.cache_resource
+def get_step_visualizer() -> StepVisualizer:
+    """Get the shared (stateless) step visualizer."""
+    return StepVisualizer()
+
+@st.cache_resource
+def get_flowchart_generator() -> "FlowchartGenerator":
+    """Get the shared (stateless) flowchart generator."""
+    from visualization.flowchart import FlowchartGenerator
+    return FlowchartGenerator()
+
+@st.cache_resource
+def get_inference_worker() -> InferenceWorker:
+    """Get the process-wide background inference worker."""
+    return InferenceWorker()
+
+@st.cache_data
+def _get_examples(category: str) -> Tuple[Dict[str, str], ...]:
+    """Get the example problems for a category ("math", "logic" or "riddle")."""
+    examples = ExampleProblems()
+    return {
+        "math": examples.get_math_problems,
+        "logic": examples.get_logic_problems,
+        "riddle": examples.get_riddles
+    }[category]()
+
+# Chart builders take the steps as a JSON string so Streamlit can hash the cache key
+@st.cache_data(show_spinner=False)
+def _build_flowchart(steps_json: str):
+    """Build the reasoning flowchart for serialized steps."""
+    return get_flowchart_generator().create_flowchart(json.loads(steps_json))
+
+@st.cache_data(show_spinner=False)
+def _build_distribution(steps_json: str):
+    """Build the step type distribution chart for serialized steps."""
+    return get_flowchart_generator().create_step_distribution(json.loads(steps_json))
+
+@st.cache_data(show_spinner=False)
+def _build_timeline(steps_json: str):
+    """Build the step timeline chart for serialized steps."""
+    return get_flowchart_generator().create_step_timeline(json.loads(steps_json))
+
+def _pick_example(category: str):
+    """Load a random example problem into the problem input (runs as a button callback)."""
+    st.session_state.problem_input = random.choice(_get_examples(category))['question']
+
+def display_results(result: Dict[str, object]):
+    """Render a finished generation: reasoning steps, visualizations and generation info."""
+    cot_response = result["response"]
+    steps = result["steps"]
+    generation_time = result["generation_time"]
+    time_to_first_token = result["time_to_first_token"]
+    
+    # Display results in tabs
+    tab1, tab2, tab3 = st.tabs(["💭 Reasoning Steps", "📊 Flow Visualization", "🔧 Generation Info"])
+    
+    with tab1:
+        get_step_visualizer().display_steps(steps)
+        
+        # Show generation metrics
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Generation Time", f"{generation_time:.2f}s")
+        with col2:
+            st.metric("Total Steps", len(steps))
+        with col3:
+            step_counts = Counter(step.get('type', 'reasoning') for step in steps)
+            most_common = step_counts.most_common(1)[0][0] if step_counts else "reasoning"
+            st.metric("Primary Type", most_common.title())
+        with col4:
+            st.metric("Response Length", f"{len(cot_response)} chars")
+        
+        # Final response
+        st.subheader("🤖 Complete Phi-2 Response")
+        model_info = st.session_state.model_manager.get_model_info()
+        st.info(f"**Model:** {model_info['model_type']} | **Device:** {model_info['device']} | **Parameters:** {model_info['total_parameters']}")
+        
+        # Only send the full raw text to the browser when asked; it would otherwise go out on every rerun
+        if st.toggle("View raw model output", key="show_raw_output"):
+            st.code(cot_response, language="markdown")
+    
+    with tab2:
+        try:
+            steps_json = json.dumps(steps, sort_keys=True)
+            flowchart = _build_flowchart(steps_json)
+            st.plotly_chart(flowchart, use_container_width=True)
+            
+            # Additional visualizations
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.subheader("📈 Step Distribution")
+                distribution = _build_distribution(steps_json)
+                st.plotly_chart(distribution, use_container_width=True)
+            
+            with col2:
+                st.subheader("🕐 Step Timeline")
+                timeline = _build_timeline(steps_json)
+                st.plotly_chart(timeline, use_container_width=True)
+        
+        except Exception as e:
+            st.error(f"Error creating visualizations: {str(e)}")
+            st.info("Flowchart visualization not available")
+    
+    with tab3:
+        st.subheader("🔧 Generation Configuration")
+        
+        # Show current settings
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Model Settings:**")
+            st.markdown(f"- Temperature: {result['temperature']}")
+            st.markdown(f"- Top-p: {result['top_p']}")
+            st.markdown(f"- Max Length: {result['max_length']}")
+            st.markdown(f"- Quantization: {model_info['quantization']} ({model_info['weight_bits']}-bit weights)")
+            st.markdown(f"- KV Cache: {model_info['kv_dtype']}")
+        
+        with col2:
+            st.markdown("**Performance Metrics:**")
+            st.markdown(f"- Generation Time: {generation_time:.2f}s")
+            st.markdown(f"- Time to First Token: {time_to_first_token:.2f}s")
+            st.markdown(f"- Response Length: {len(cot_response)} characters")
+            st.markdown(f"- Steps Parsed: {len(steps)}")
+            st.markdown(f"- Model Device: {model_info['device']}")
+        
+        # Show generation stats
+        stats = st.session_state.cot_generator.get_generation_stats()
+        st.subheader("📊 Model Statistics")
+        st.json(stats)
+
 def main():
     st.set_page_config(
         page_title="Chain of Thought Visualizer",
@@ -33,16 +272,9 @@ def main():
     st.markdown("Explore how language models think step-by-step through complex problems using **real Phi-2 model**")
     
     # Initialize session state
-    if 'model_manager' not in st.session_state:
-        st.session_state.model_manager = None
-    if 'cot_generator' not in st.session_state:
-        st.session_state.cot_generator = None
-    if 'step_visualizer' not in st.session_state:
-        st.session_state.step_visualizer = StepVisualizer()
-    if 'flowchart_generator' not in st.session_state:
-        st.session_state.flowchart_generator = FlowchartGenerator()
-    if 'model_loading' not in st.session_state:
-        st.session_state.model_loading = False
+    for key, value in _SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
     
     # Check authentication first
     auth_ok, auth_status = check_auth_token()
@@ -65,6 +297,19 @@ def main():
             """)
             st.stop()
         
+        caps = _device_caps()
+        # MPS has no quantized kernels (bitsandbytes is CUDA-only and OpenVINO CPU-only), so it only offers fp16
+        on_mps = caps["mps"] and not caps["cuda"]
+        quantization_modes = ("fp16",) if on_mps else QUANTIZATION_MODES
+        default_quantization = "int4" if caps["cuda"] else "fp16" if on_mps else "int8"
+        default_threads = None if caps["cuda"] or caps["mps"] else physical_cpu_count()
+        default_model_key = ("microsoft/phi-2", default_quantization, default_threads)
+        
+        # Load the default configuration while the user is still reading the landing page
+        preload = None
+        if os.getenv("PRELOAD_MODEL", "1") != "0":
+            preload = _start_model_preload(*default_model_key)
+        
         # Model status display
         if st.session_state.model_manager and st.session_state.model_manager.is_ready():
             model_info = st.session_state.model_manager.get_model_info()
@@ -73,71 +318,87 @@ def main():
             st.markdown(f"**Device:** {model_info['device']}")
             st.markdown(f"**Parameters:** {model_info['total_parameters']}")
             if model_info['quantized']:
-                st.info("🔧 Using 4-bit quantization")
+                st.info(f"🔧 Using {model_info['quantization']} weights ({model_info['backend']})")
         else:
             st.warning("⚠️ Model Not Loaded")
             st.markdown("Click 'Initialize Model' to load Phi-2")
+            if preload and preload["thread"].is_alive():
+                st.caption("⏳ Preloading the default model in the background...")
         
         st.markdown("---")
         
         # Model configuration options
         st.subheader("🔧 Configuration")
         
-        use_quantization = st.checkbox(
-            "Use 4-bit Quantization", 
-            value=True, 
-            help="Reduces memory usage but may slightly affect performance"
-        )
-        
-        max_length = st.slider(
-            "Max Response Length", 
-            min_value=100, 
-            max_value=2000, 
-            value=1024, 
-            step=100,
-            help="Maximum number of tokens in the response"
-        )
-        
-        temperature = st.slider(
-            "Temperature", 
-            min_value=0.1, 
-            max_value=1.5, 
-            value=0.3, 
-            step=0.1,
-            help="Controls randomness (higher = more creative, lower = more focused)"
-        )
-        
-        top_p = st.slider(
-            "Top-p (Nucleus Sampling)", 
-            min_value=0.1, 
-            max_value=1.0, 
-            value=0.9, 
-            step=0.05,
-            help="Controls diversity of responses"
-        )
+        # Model settings only take effect on Initialize, so batch them into one rerun
+        with st.form("model_form", border=False):
+            quantization = st.radio(
+                "Quantization",
+                options=list(quantization_modes),
+                index=quantization_modes.index(default_quantization),
+                horizontal=True,
+                help="int8/int4 use bitsandbytes on CUDA and OpenVINO weight-only compression on CPU; fp16 loads full-precision weights"
+            )
+        
+            max_length = st.slider(
+                "Max Response Length", 
+                min_value=100, 
+                max_value=2000, 
+                value=1024, 
+                step=100,
+                help="Maximum number of tokens in the response"
+            )
+        
+            # Thread count only matters for CPU inference
+            num_threads = None
+            if default_threads is not None:
+                num_threads = st.number_input(
+                    "CPU Threads",
+                    min_value=1,
+                    max_value=max(os.cpu_count() or 1, default_threads),
+                    value=default_threads,
+                    step=1,
+                    help="Number of PyTorch threads for CPU inference (defaults to the physical core count)"
+                )
+        
+            initialize_clicked = st.form_submit_button(
+                "🚀 Initialize Phi-2 Model",
+                type="primary",
+                disabled=st.session_state.model_loading
+            )
         
         # Initialize model button
-        if st.button("🚀 Initialize Phi-2 Model", type="primary", disabled=st.session_state.model_loading):
+        if initialize_clicked:
             if not st.session_state.model_loading:
                 st.session_state.model_loading = True
                 
                 with st.spinner("Loading Phi-2 model (this may take a few minutes)..."):
                     try:
-                        # Clean up existing model if any
-                        if st.session_state.model_manager:
-                            st.session_state.model_manager.cleanup()
+                        model_key = ("microsoft/phi-2", quantization, num_threads)
+                        current_manager = st.session_state.model_manager
+                        current_key = st.session_state.model_key
                         
-                        # Initialize new model
-                        st.session_state.model_manager = ModelManager(
-                            model_name="microsoft/phi-2",
-                            use_quantization=use_quantization
-                        )
+                        if preload:
+                            # Only wait for a preload of the requested configuration, which then returns instantly
+                            # below; a different one is abandoned and frees itself once it finishes loading
+                            with preload["lock"]:
+                                if model_key != preload["model_key"] and preload["manager"] is None:
+                                    preload["abandoned"] = True
+                            if model_key == preload["model_key"]:
+                                preload["thread"].join()
+                            if current_manager is None and preload["manager"] is not None:
+                                current_manager, current_key = preload["manager"], preload["model_key"]
                         
-                        # Initialize CoT generator
-                        st.session_state.cot_generator = CoTGenerator(
-                            st.session_state.model_manager,
-                            max_length=max_length
-                        )
+                        # Release the old model before loading a different configuration
+                        if current_manager and current_key != model_key:
+                            _evict_model(current_key, current_manager, preload)
+                            st.session_state.model_manager = None
+                            st.session_state.cot_generator = None
+                        
+                        # Get the shared model, loading it only if this configuration isn't cached
+                        st.session_state.model_manager = get_model_manager(*model_key)
+                        st.session_state.cot_generator = get_cot_generator(*model_key, max_length)
+                        st.session_state.model_key = model_key
                         
                         st.success("✅ Phi-2 model loaded successfully!")
                         st.balloons()
@@ -146,6 +407,7 @@ def main():
                         st.error(f"❌ Error loading model: {str(e)}")
                         st.session_state.model_manager = None
                         st.session_state.cot_generator = None
+                        st.session_state.model_key = None
                     finally:
                         st.session_state.model_loading = False
                         st.rerun()
@@ -153,9 +415,10 @@ def main():
         # Cleanup button
         if st.session_state.model_manager and st.session_state.model_manager.is_ready():
             if st.button("🗑️ Unload Model", type="secondary"):
-                st.session_state.model_manager.cleanup()
+                _evict_model(st.session_state.model_key, st.session_state.model_manager, preload)
                 st.session_state.model_manager = None
                 st.session_state.cot_generator = None
+                st.session_state.model_key = None
                 st.success("Model unloaded successfully!")
                 st.rerun()
         
@@ -163,11 +426,10 @@ def main():
         
         # System requirements
         st.subheader("💻 System Info")
-        import torch
-        if torch.cuda.is_available():
+        if caps["cuda"]:
             st.success("✅ CUDA Available")
-            st.markdown(f"GPU: {torch.cuda.get_device_name(0)}")
-        elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
+            st.markdown(f"GPU: {caps['gpu_name']}")
+        elif caps["mps"]:
             st.info("🍎 MPS (Apple Silicon) Available")
         else:
             st.warning("⚠️ CPU Only (slower)")
@@ -196,27 +458,25 @@ def main():
             **Model:** Microsoft Phi-2 (2.7B parameters)
             **Framework:** Hugging Face Transformers
             **Hardware:** Automatic GPU/CPU detection
-            **Optimization:** Optional 4-bit quantization
+            **Optimization:** INT8/INT4 weight quantization (bitsandbytes on GPU, OpenVINO on CPU)
             
             The model will generate real, dynamic reasoning chains for your problems.
             """)
         
         # Show example problems
         st.markdown("### 📝 Example Problems")
-        examples = ExampleProblems()
-        
         tab1, tab2, tab3 = st.tabs(["🧮 Math", "🧩 Logic", "🤔 Riddles"])
         
         with tab1:
-            for i, problem in enumerate(examples.get_math_problems()[:3]):
+            for i, problem in enumerate(_get_examples("math")[:3]):
                 st.markdown(f"**{i+1}.** {problem['question']}")
         
         with tab2:
-            for i, problem in enumerate(examples.get_logic_problems()[:3]):
+            for i, problem in enumerate(_get_examples("logic")[:3]):
                 st.markdown(f"**{i+1}.** {problem['question']}")
         
         with tab3:
-            for i, problem in enumerate(examples.get_riddles()[:3]):
+            for i, problem in enumerate(_get_examples("riddle")[:3]):
                 st.markdown(f"**{i+1}.** {problem['question']}")
         
         return
@@ -228,150 +488,153 @@ def main():
     col1, col2 = st.columns([3, 1])
     
     with col1:
-        problem_to_solve = st.text_area(
-            "Enter your problem:",
-            value="If a train leaves the station at 3 PM traveling at 60 mph and needs to cover 180 miles, what time will it arrive?",
-            height=100,
-            help="Modify this problem or enter your own"
-        )
+        # Editing the problem or dragging the sliders only reruns the script on submit
+        with st.form("gen_form", border=False):
+            problem_to_solve = st.text_area(
+                "Enter your problem:",
+                key="problem_input",
+                height=100,
+                help="Modify this problem or enter your own"
+            )
+            
+            slider_col1, slider_col2 = st.columns(2)
+            
+            with slider_col1:
+                temperature = st.slider(
+                    "Temperature", 
+                    min_value=0.1, 
+                    max_value=1.5, 
+                    value=0.3, 
+                    step=0.1,
+                    help="Controls randomness (higher = more creative, lower = more focused)"
+                )
+            
+            with slider_col2:
+                top_p = st.slider(
+                    "Top-p (Nucleus Sampling)", 
+                    min_value=0.1, 
+                    max_value=1.0, 
+                    value=0.9, 
+                    step=0.05,
+                    help="Controls diversity of responses"
+                )
+            
+            generate_clicked = st.form_submit_button("🚀 Generate Chain of Thought", type="primary")
     
     with col2:
         st.markdown("**Or try an example:**")
-        examples = ExampleProblems()
-        
-        if st.button("🧮 Math Problem"):
-            problem = examples.get_random_problem("math")
-            st.session_state.example_problem = problem['question']
-            st.rerun()
-        
-        if st.button("🧩 Logic Problem"):
-            problem = examples.get_random_problem("logic")
-            st.session_state.example_problem = problem['question']
-            st.rerun()
-        
-        if st.button("🤔 Riddle"):
-            problem = examples.get_random_problem("riddle")
-            st.session_state.example_problem = problem['question']
-            st.rerun()
-    
-    # Update problem if example was selected
-    if 'example_problem' in st.session_state:
-        problem_to_solve = st.session_state.example_problem
-        del st.session_state.example_problem
+        
+        # Callbacks update the input before the rerun renders it, so no extra st.rerun() is needed
+        st.button("🧮 Math Problem", on_click=_pick_example, args=("math",))
+        st.button("🧩 Logic Problem", on_click=_pick_example, args=("logic",))
+        st.button("🤔 Riddle", on_click=_pick_example, args=("riddle",))
+        
+        if st.button("👀 Preview All Examples", help="Run one math, logic and riddle example through the model in a single batched call"):
+            preview_types = ["math", "logic", "riddle"]
+            preview_problems = [random.choice(_get_examples(t))['question'] for t in preview_types]
+            
+            with st.spinner("Generating example previews..."):
+                try:
+                    responses = st.session_state.cot_generator.generate_cot_batch(
+                        preview_problems,
+                        temperature=temperature,
+                        top_p=top_p
+                    )
+                    st.session_state.example_responses = [
+                        {
+                            "question": question,
+                            "response": response,
+                            "steps": st.session_state.cot_generator.parse_steps(response)
+                        }
+                        for question, response in zip(preview_problems, responses)
+                    ]
+                except Exception as e:
+                    st.error(f"❌ Error generating previews: {str(e)}")
     
-    if problem_to_solve and st.button("🚀 Generate Chain of Thought", type="primary"):
+    if generate_clicked and problem_to_solve:
         if st.session_state.cot_generator is None:
             st.error("Please load a model first!")
             return
             
-        st.header("🔍 Chain of Thought Analysis")
+        worker = get_inference_worker()
         
-        # Generation progress
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        # A new request supersedes any generation still in flight
+        if st.session_state.pending_request:
+            worker.cancel(st.session_state.pending_request["id"])
+            worker.discard(st.session_state.pending_request["id"])
         
-        try:
-            # Update progress
-            progress_bar.progress(25)
-            status_text.text("Analyzing problem type...")
-            
-            # Generate CoT response
-            progress_bar.progress(50)
-            status_text.text("Generating reasoning with Phi-2...")
-            
-            start_time = time.time()
-            cot_response = st.session_state.cot_generator.generate_cot(
+        st.session_state.pending_request = {
+            "id": worker.submit(
+                st.session_state.cot_generator,
                 problem_to_solve,
                 temperature=temperature,
                 top_p=top_p
-            )
-            generation_time = time.time() - start_time
-            
-            progress_bar.progress(75)
-            status_text.text("Parsing reasoning steps...")
-            
-            # Parse steps
-            steps = st.session_state.cot_generator.parse_steps(cot_response)
+            ),
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_length": max_length
+        }
+        st.session_state.last_result = None
             
-            progress_bar.progress(100)
-            status_text.text("Complete!")
+    if st.session_state.pending_request or st.session_state.last_result:
+        st.header("🔍 Chain of Thought Analysis")
+    
+    # Follow the in-flight request; reruns pick it up again without interrupting the worker
+    if st.session_state.pending_request:
+        pending = st.session_state.pending_request
+        worker = get_inference_worker()
+        
+        cancel_placeholder = st.empty()
+        
+        if cancel_placeholder.button("⏹️ Cancel Generation"):
+            worker.cancel(pending["id"])
+            worker.discard(pending["id"])
+            st.session_state.pending_request = None
+            st.info("Generation cancelled.")
+        else:
+            # Live output, filled in as tokens arrive
+            stream_placeholder = st.empty()
             
-            # Display results in tabs
-            tab1, tab2, tab3 = st.tabs(["💭 Reasoning Steps", "📊 Flow Visualization", "🔧 Generation Info"])
+            result = worker.get_result(pending["id"])
+            while result and result["status"] in ("queued", "running"):
+                stream_placeholder.markdown(result["response"] + "▌")
+                time.sleep(0.2)
+                result = worker.get_result(pending["id"])
             
-            with tab1:
-                st.session_state.step_visualizer.display_steps(steps)
-                
-                # Show generation metrics
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("Generation Time", f"{generation_time:.2f}s")
-                with col2:
-                    st.metric("Total Steps", len(steps))
-                with col3:
-                    step_types = [step.get('type', 'reasoning') for step in steps]
-                    most_common = max(set(step_types), key=step_types.count) if step_types else "reasoning"
-                    st.metric("Primary Type", most_common.title())
-                with col4:
-                    st.metric("Response Length", f"{len(cot_response)} chars")
-                
-                # Final response
-                st.subheader("🤖 Complete Phi-2 Response")
-                model_info = st.session_state.model_manager.get_model_info()
-                st.info(f"**Model:** {model_info['model_type']} | **Device:** {model_info['device']} | **Parameters:** {model_info['total_parameters']}")
-                
-                with st.expander("View raw model output", expanded=False):
-                    st.text_area("Complete reasoning output:", value=cot_response, height=200, disabled=True)
+            stream_placeholder.empty()
+            cancel_placeholder.empty()
+            worker.discard(pending["id"])
+            st.session_state.pending_request = None
             
-            with tab2:
-                try:
-                    flowchart = st.session_state.flowchart_generator.create_flowchart(steps)
-                    st.plotly_chart(flowchart, use_container_width=True)
-                    
-                    # Additional visualizations
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.subheader("📈 Step Distribution")
-                        distribution = st.session_state.flowchart_generator.create_step_distribution(steps)
-                        st.plotly_chart(distribution, use_container_width=True)
-                    
-                    with col2:
-                        st.subheader("🕐 Step Timeline")
-                        timeline = st.session_state.flowchart_generator.create_step_timeline(steps)
-                        st.plotly_chart(timeline, use_container_width=True)
-                        
-                except Exception as e:
-                    st.error(f"Error creating visualizations: {str(e)}")
-                    st.info("Flowchart visualization not available")
+            if result and result["status"] == "done":
+                cot_response = result["response"].strip()
+                st.session_state.last_result = {
+                    **pending,
+                    "response": cot_response,
+                    "steps": st.session_state.cot_generator.parse_steps(cot_response),
+                    "generation_time": result["generation_time"],
+                    "time_to_first_token": result["time_to_first_token"] or result["generation_time"]
+                }
+            else:
+                error = result["error"] if result else "request was lost"
+                st.error(f"❌ Error generating response: {error}")
+                st.info("Try adjusting the model settings or rephrasing your problem.")
             
-            with tab3:
-                st.subheader("🔧 Generation Configuration")
-                
-                # Show current settings
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("**Model Settings:**")
-                    st.markdown(f"- Temperature: {temperature}")
-                    st.markdown(f"- Top-p: {top_p}")
-                    st.markdown(f"- Max Length: {max_length}")
-                    st.markdown(f"- Quantization: {'Yes' if use_quantization else 'No'}")
-                
-                with col2:
-                    st.markdown("**Performance Metrics:**")
-                    st.markdown(f"- Generation Time: {generation_time:.2f}s")
-                    st.markdown(f"- Response Length: {len(cot_response)} characters")
-                    st.markdown(f"- Steps Parsed: {len(steps)}")
-                    st.markdown(f"- Model Device: {model_info['device']}")
-                
-                # Show generation stats
-                stats = st.session_state.cot_generator.get_generation_stats()
-                st.subheader("📊 Model Statistics")
-                st.json(stats)
-                
+    if st.session_state.last_result:
+        try:
+            display_results(st.session_state.last_result)
         except Exception as e:
-            st.error(f"❌ Error generating response: {str(e)}")
-            st.info("Try adjusting the model settings or rephrasing your problem.")
+            st.error(f"❌ Error displaying results: {str(e)}")
+    
+    # Batched example previews
+    if st.session_state.example_responses:
+        st.header("👀 Example Previews")
+        
+        preview_tabs = st.tabs(["🧮 Math", "🧩 Logic", "🤔 Riddles"])
+        for tab, preview in zip(preview_tabs, st.session_state.example_responses):
+            with tab:
+                st.markdown(f"**Problem:** {preview['question']}")
+                get_step_visualizer().display_compact_steps(preview['steps'])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,7 @@
+"""Core model, generation and example-problem components for ThoughtChain."""
+import os
+
+# Expandable segments let the CUDA caching allocator grow blocks in place, so KV caches of varying
+# prompt lengths don't fragment the pool. PyTorch reads this when CUDA first initializes, and importing
+# any core module runs this before app.py or the demo probe the device
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
@@ -1,20 +1,114 @@
 import re
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Iterable, Tuple
 import time
+import functools
+
+from core.hardware import QUANTIZATION_TRADEOFFS
+from core.keywords import tagged_keyword_regex, match_category
 
 logger = logging.getLogger(__name__)
 
+# Step boundary patterns for real model outputs
+_STEP_PATTERNS = (
+    r'Step\s+\d+[:\-]?\s*',  # Step 1:, Step 1-, Step 1
+    r'\d+[\.\)]\s*',         # 1., 1), 2., 2)
+    r'First[,\s]',           # First, First
+    r'Second[,\s]',          # Second, Second
+    r'Third[,\s]',           # Third, Third
+    r'Fourth[,\s]',          # Fourth, Fourth
+    r'Fifth[,\s]',           # Fifth, Fifth
+    r'Next[,\s]',            # Next, Next
+    r'Then[,\s]',            # Then, Then
+    r'Now[,\s]',             # Now, Now
+    r'Finally[,\s]',         # Finally, Finally
+    r'Therefore[,\s]',       # Therefore, Therefore
+    r'So[,\s]',              # So, So
+    r'Thus[,\s]',            # Thus, Thus
+    r'Hence[,\s]',           # Hence, Hence
+    r'As\s+a\s+result[,\s]', # As a result, As a result
+    r'In\s+conclusion[,\s]', # In conclusion, In conclusion
+    r'To\s+summarize[,\s]',  # To summarize, To summarize
+    r'Let\s+me\s+',          # Let me
+    r'I\s+need\s+to\s+',     # I need to
+    r'I\s+will\s+',          # I will
+    r'I\s+should\s+',        # I should
+    r'I\s+can\s+',           # I can
+    r'We\s+can\s+',          # We can
+    r'We\s+need\s+to\s+',    # We need to
+)
+
+# Trailing whitespace of a boundary pattern, rewritten so the marker needs more text on its line
+_PATTERN_TAILS = (
+    (r"[,\s]", r"(?:,|[^\S\n]+\S)"),  # a comma, or whitespace before more text
+    (r"\s+", r"[^\S\n]+\S"),          # whitespace before more text
+    (r"\s*", ""),                      # optional whitespace: the marker itself ends in text
+)
+
+def _line_pattern(pattern: str) -> str:
+    """Rewrite a boundary pattern so it never crosses a line break and ends on the line's text."""
+    tail = ""
+    for suffix, replacement in _PATTERN_TAILS:
+        if pattern.endswith(suffix):
+            pattern, tail = pattern[:-len(suffix)], replacement
+            break
+    return pattern.replace(r"[,\s]", r"(?:,|\s)").replace(r"\s", r"[^\S\n]") + tail
+
+# All boundary patterns compiled once into a single alternation, matched right after a line break.
+# A marker ending in whitespace must be followed by more text on its line, as on a stripped line.
+_STEP_RE = re.compile(
+    r"\n[^\S\n]*(?:" + "|".join(f"(?:{_line_pattern(pattern)})" for pattern in _STEP_PATTERNS) + ")",
+    re.IGNORECASE
+)
+
+# Problem type keywords
+_PROBLEM_TYPE_RE = tagged_keyword_regex({
+    "math": ['calculate', 'solve', 'equation', 'multiply', 'divide', 'add', 'subtract', 
+             'percent', '%', 'fraction', 'decimal', 'number', 'sum', 'difference',
+             'mph', 'miles', 'hours', 'minutes', 'seconds', 'distance', 'time',
+             'workers', 'days', 'build', 'complete', 'fence', 'perimeter', 'area',
+             'price', 'cost', 'discount', 'tax', 'total', 'amount'],
+    "logic": ['if', 'then', 'either', 'or', 'all', 'some', 'none', 'always', 'never',
+              'taller', 'shorter', 'faster', 'slower', 'before', 'after', 'position',
+              'race', 'finished', 'student', 'passed', 'class', 'roses', 'flowers',
+              'conclude', 'therefore', 'because', 'since', 'given', 'assume'],
+    "riddle": ['riddle', 'what am i', 'guess', 'mystery', 'puzzle', 'keys', 'locks',
+               'space', 'room', 'enter', 'outside', 'wetter', 'dries', 'young', 'old',
+               'eye', 'cannot see', 'take', 'leave behind', 'clue', 'hint']
+})
+
+# Runs of text between sentence-ending punctuation, for the fallback parser
+_SENTENCE_RE = re.compile(r"[^.!?]+")
+
+# Step type indicators
+_STEP_TYPE_RE = tagged_keyword_regex({
+    "calculation": ['calculate', 'multiply', 'divide', 'add', 'subtract', 
+                    'formula', 'equation', '=', '+', '-', '*', '/', '×', '÷'],
+    "conclusion": ['therefore', 'so', 'conclude', 'answer', 'result', 
+                   'thus', 'hence', 'finally', 'in conclusion', 'as a result'],
+    "assumption": ['assume', 'given', 'known', 'fact', 'premise', 
+                   'suppose', 'let', 'if', 'since', 'because'],
+    "analysis": ['analyze', 'examine', 'consider', 'think', 'reason',
+                 'understand', 'identify', 'determine', 'find']
+})
+
+# Classification is a pure function of the text, so repeated problems and step phrasings hit the cache
+@functools.lru_cache(maxsize=4096)
+def _detect_problem_type_cached(problem: str) -> str:
+    """Get the problem type for a problem string."""
+    return match_category(_PROBLEM_TYPE_RE, problem, "general")
+
+@functools.lru_cache(maxsize=4096)
+def _classify_step_cached(step_content: str) -> str:
+    """Get the step type for a step's content."""
+    return match_category(_STEP_TYPE_RE, step_content, "reasoning")
+
 class CoTGenerator:
     """Generates Chain of Thought reasoning using a real language model."""
     
-    def __init__(self, model_manager, max_length=1024):
-        self.model_manager = model_manager
-        self.max_length = max_length
-        
-        # Enhanced CoT templates for better reasoning
-        self.cot_templates = {
-            "math": """Let's solve this step by step:
+    # Enhanced CoT templates for better reasoning
+    COT_TEMPLATES = {
+        "math": """Let's solve this step by step:
 
 1) First, I need to understand what's being asked
 2) I'll break down the problem into smaller parts
@@ -24,8 +118,8 @@ class CoTGenerator:
 Problem: {problem}
 
 Let me think through this:""",
-            
-            "logic": """Let's analyze this logically:
+        
+        "logic": """Let's analyze this logically:
 
 1) I'll identify the key information given
 2) I'll look for relationships and patterns
@@ -35,8 +129,8 @@ Let me think through this:""",
 Problem: {problem}
 
 Let me think through this:""",
-            
-            "riddle": """Let's solve this riddle:
+        
+        "riddle": """Let's solve this riddle:
 
 1) I'll read the riddle carefully
 2) I'll look for wordplay and metaphors
@@ -46,8 +140,8 @@ Let me think through this:""",
 Problem: {problem}
 
 Let me think through this:""",
-            
-            "general": """Let's think through this step by step:
+        
+        "general": """Let's think through this step by step:
 
 1) I'll understand the problem clearly
 2) I'll break it down into manageable parts
@@ -57,38 +151,15 @@ Let me think through this:""",
 Problem: {problem}
 
 Let me think through this:"""
-        }
+    }
+    
+    def __init__(self, model_manager, max_length=1024):
+        self.model_manager = model_manager
+        self.max_length = max_length
     
     def _detect_problem_type(self, problem: str) -> str:
         """Detect the type of problem to use appropriate template."""
-        problem_lower = problem.lower()
-        
-        # Enhanced math keywords
-        math_keywords = ['calculate', 'solve', 'equation', 'multiply', 'divide', 'add', 'subtract', 
-                        'percent', '%', 'fraction', 'decimal', 'number', 'sum', 'difference',
-                        'mph', 'miles', 'hours', 'minutes', 'seconds', 'distance', 'time',
-                        'workers', 'days', 'build', 'complete', 'fence', 'perimeter', 'area',
-                        'price', 'cost', 'discount', 'tax', 'total', 'amount']
-        
-        # Enhanced logic keywords
-        logic_keywords = ['if', 'then', 'either', 'or', 'all', 'some', 'none', 'always', 'never',
-                         'taller', 'shorter', 'faster', 'slower', 'before', 'after', 'position',
-                         'race', 'finished', 'student', 'passed', 'class', 'roses', 'flowers',
-                         'conclude', 'therefore', 'because', 'since', 'given', 'assume']
-        
-        # Enhanced riddle keywords
-        riddle_keywords = ['riddle', 'what am i', 'guess', 'mystery', 'puzzle', 'keys', 'locks',
-                          'space', 'room', 'enter', 'outside', 'wetter', 'dries', 'young', 'old',
-                          'eye', 'cannot see', 'take', 'leave behind', 'clue', 'hint']
-        
-        if any(keyword in problem_lower for keyword in math_keywords):
-            return "math"
-        elif any(keyword in problem_lower for keyword in logic_keywords):
-            return "logic"
-        elif any(keyword in problem_lower for keyword in riddle_keywords):
-            return "riddle"
-        else:
-            return "general"
+        return _detect_problem_type_cached(problem)
     
     def generate_cot(self, problem: str, temperature: float = 0.3, top_p: float = 0.9) -> str:
         """Generate Chain of Thought reasoning for a given problem."""
@@ -110,76 +181,136 @@ Let me think through this:"""
             logger.error(f"Error generating CoT: {e}")
             raise e
     
+    def generate_cot_stream(self, problem: str, temperature: float = 0.3, top_p: float = 0.9) -> Iterator[str]:
+        """Stream Chain of Thought reasoning for a given problem as text chunks."""
+        if not self.model_manager or not self.model_manager.is_ready():
+            raise RuntimeError("Model not ready. Please initialize the model first.")
+        
+        yield from self.model_manager.stream_response(
+            problem,
+            max_length=self.max_length,
+            temperature=temperature,
+            top_p=top_p
+        )
+    
+    def generate_cot_batch(self, problems: List[str], temperature: float = 0.3, top_p: float = 0.9) -> List[str]:
+        """Generate Chain of Thought reasoning for several problems in one batched model call."""
+        if not self.model_manager or not self.model_manager.is_ready():
+            raise RuntimeError("Model not ready. Please initialize the model first.")
+        
+        try:
+            return self.model_manager.generate_response_batch(
+                problems,
+                max_length=self.max_length,
+                temperature=temperature,
+                top_p=top_p
+            )
+            
+        except Exception as e:
+            logger.error(f"Error generating batched CoT: {e}")
+            raise e
+    
+    def generate_cot_multiplex(self, problems: List[str], temperature: float = 0.3, top_p: float = 0.9) -> List[str]:
+        """Generate Chain of Thought reasoning for several problems packed into a single prompt."""
+        if not self.model_manager or not self.model_manager.is_ready():
+            raise RuntimeError("Model not ready. Please initialize the model first.")
+        
+        try:
+            # One response has to hold every solution, so scale the token budget with the problem count
+            # (the model manager caps it at what the context window leaves after the prompt)
+            return self.model_manager.generate_response_multiplex(
+                problems,
+                max_length=self.max_length * len(problems),
+                temperature=temperature,
+                top_p=top_p
+            )
+        
+        except Exception as e:
+            logger.error(f"Error generating multiplexed CoT: {e}")
+            raise e
+    
+    def generate_and_parse_streaming(self, problem: str, temperature: float = 0.3, top_p: float = 0.9) -> Iterator[Dict[str, str]]:
+        """Generate Chain of Thought reasoning and yield each parsed step as soon as it is complete."""
+        yield from self.parse_steps_stream(self.generate_cot_stream(problem, temperature=temperature, top_p=top_p))
+    
+    def parse_steps_stream(self, chunks: Iterable[str]) -> Iterator[Dict[str, str]]:
+        """Parse streamed response chunks into reasoning steps, yielding each step once the next one begins."""
+        pieces = []
+        buffer = ""  # Text from the start of the current step onwards
+        scanned = 0  # Offset in buffer of the first line not yet scanned for a step boundary
+        step_number = 1
+        
+        def finish_lines(line_end: int) -> Iterator[Dict[str, str]]:
+            """Scan the lines up to line_end for step boundaries and yield the steps they close."""
+            nonlocal buffer, scanned, step_number
+            
+            start = 0
+            for match in _STEP_RE.finditer("\n" + buffer[scanned:line_end]):
+                boundary = scanned + match.start()
+                step_data = self._create_step_data(self._segment_content(buffer[start:boundary]), step_number)
+                start = boundary
+                if step_data:
+                    step_number += 1
+                    yield step_data
+            
+            buffer = buffer[start:]
+            scanned = line_end - start
+        
+        for chunk in chunks:
+            pieces.append(chunk)
+            buffer += chunk
+            
+            # Only complete lines are scanned, as the line still being decoded could yet open a step
+            line_end = buffer.rfind("\n") + 1
+            if line_end > scanned:
+                yield from finish_lines(line_end)
+        
+        # The response is complete: scan its last line and close the final step
+        yield from finish_lines(len(buffer))
+        step_data = self._create_step_data(self._segment_content(buffer), step_number)
+        if step_data:
+            step_number += 1
+            yield step_data
+        
+        # If no steps were found, try alternative parsing
+        if step_number == 1:
+            yield from self._fallback_parsing("".join(pieces))
+    
     def parse_steps(self, cot_response: str) -> List[Dict[str, str]]:
         """Parse the CoT response into individual reasoning steps with enhanced pattern matching."""
+        # Hand out copies so callers can't modify the cached steps
+        return [dict(step) for step in self._parse_steps_cached(cot_response)]
+    
+    # Parsing is a pure function of the response, so identical outputs (retries, benchmarks) reuse their steps.
+    # The cache is keyed on the class rather than the instance, so it never keeps a generator (or its model) alive.
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _parse_steps_cached(cls, cot_response: str) -> List[Dict[str, str]]:
+        """Parse the CoT response into steps, caching the result."""
+        return cls._parse_steps_uncached(cot_response)
+    
+    @classmethod
+    def _parse_steps_uncached(cls, cot_response: str) -> List[Dict[str, str]]:
+        """Parse the CoT response into steps, bypassing the parse cache."""
         try:
             steps = []
             
-            # Enhanced step patterns for real model outputs
-            step_patterns = [
-                r'Step\s+\d+[:\-]?\s*',  # Step 1:, Step 1-, Step 1 
-                r'\d+[\.\)]\s*',         # 1., 1), 2., 2)
-                r'First[,\s]',           # First, First 
-                r'Second[,\s]',          # Second, Second 
-                r'Third[,\s]',           # Third, Third 
-                r'Fourth[,\s]',          # Fourth, Fourth 
-                r'Fifth[,\s]',           # Fifth, Fifth 
-                r'Next[,\s]',            # Next, Next 
-                r'Then[,\s]',            # Then, Then 
-                r'Now[,\s]',             # Now, Now 
-                r'Finally[,\s]',         # Finally, Finally 
-                r'Therefore[,\s]',       # Therefore, Therefore 
-                r'So[,\s]',              # So, So 
-                r'Thus[,\s]',            # Thus, Thus 
-                r'Hence[,\s]',           # Hence, Hence 
-                r'As\s+a\s+result[,\s]', # As a result, As a result 
-                r'In\s+conclusion[,\s]', # In conclusion, In conclusion 
-                r'To\s+summarize[,\s]',  # To summarize, To summarize 
-                r'Let\s+me\s+',          # Let me 
-                r'I\s+need\s+to\s+',     # I need to 
-                r'I\s+will\s+',          # I will 
-                r'I\s+should\s+',        # I should 
-                r'I\s+can\s+',           # I can 
-                r'We\s+can\s+',          # We can 
-                r'We\s+need\s+to\s+',    # We need to 
-            ]
+            # Split the response at every line that opens a new step, in one regex pass. The leading
+            # newline covers the first line and makes each match start at its line's offset in the response.
+            boundaries = [match.start() for match in _STEP_RE.finditer("\n" + cot_response)]
+            if not boundaries or boundaries[0] != 0:
+                boundaries.insert(0, 0)
             
-            # Clean and normalize the response
-            lines = cot_response.split('\n')
-            current_step = ""
             step_number = 1
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Check if this line starts a new step
-                is_new_step = any(re.search(pattern, line, re.IGNORECASE) for pattern in step_patterns)
-                
-                if is_new_step and current_step:
-                    # Save the previous step
-                    step_data = self._create_step_data(current_step.strip(), step_number)
-                    if step_data:
-                        steps.append(step_data)
-                        step_number += 1
-                    current_step = line
-                else:
-                    # Continue building the current step
-                    if current_step:
-                        current_step += " " + line
-                    else:
-                        current_step = line
-            
-            # Add the last step
-            if current_step:
-                step_data = self._create_step_data(current_step.strip(), step_number)
+            for start, end in zip(boundaries, boundaries[1:] + [len(cot_response)]):
+                step_data = cls._create_step_data(cls._segment_content(cot_response[start:end]), step_number)
                 if step_data:
                     steps.append(step_data)
+                    step_number += 1
             
             # If no steps were found, try alternative parsing
             if not steps:
-                steps = self._fallback_parsing(cot_response)
+                steps = cls._fallback_parsing(cot_response)
             
             logger.info(f"Parsed {len(steps)} reasoning steps")
             return steps
@@ -193,7 +324,13 @@ Let me think through this:"""
                 "type": "reasoning"
             }]
     
-    def _create_step_data(self, content: str, step_number: int) -> Optional[Dict[str, str]]:
+    @staticmethod
+    def _segment_content(segment: str) -> str:
+        """Join a step segment's non-blank lines into a single line of text."""
+        return " ".join(filter(None, map(str.strip, segment.split("\n"))))
+    
+    @classmethod
+    def _create_step_data(cls, content: str, step_number: int) -> Optional[Dict[str, str]]:
         """Create step data with enhanced classification."""
         if not content or len(content.strip()) < 5:  # Skip very short content
             return None
@@ -201,57 +338,40 @@ Let me think through this:"""
         return {
             "step_number": str(step_number),
             "content": content.strip(),
-            "type": self._classify_step(content)
+            "type": cls._classify_step(content)
         }
     
-    def _fallback_parsing(self, cot_response: str) -> List[Dict[str, str]]:
+    @classmethod
+    def _fallback_parsing(cls, cot_response: str) -> List[Dict[str, str]]:
         """Fallback parsing method for when step patterns aren't found."""
-        # Split by sentences and treat each as a step
-        sentences = re.split(r'[.!?]+', cot_response)
-        steps = []
+        # Treat each substantial sentence as a step
+        return [{
+            "step_number": str(i),
+            "content": sentence,
+            "type": cls._classify_step(sentence)
+        } for i, sentence in cls._iter_sentences(cot_response)]
         
-        for i, sentence in enumerate(sentences, 1):
-            sentence = sentence.strip()
+    @staticmethod
+    def _iter_sentences(text: str) -> Iterator[Tuple[int, str]]:
+        """Lazily yield (sentence number, sentence) for each sentence long enough to be a step."""
+        # Numbered as the pieces of splitting on punctuation runs, so leading punctuation opens an empty first piece
+        first = 2 if text[:1] in (".", "!", "?") else 1
+        for i, match in enumerate(_SENTENCE_RE.finditer(text), first):
+            sentence = match.group().strip()
             if len(sentence) > 10:  # Only include substantial sentences
-                steps.append({
-                    "step_number": str(i),
-                    "content": sentence,
-                    "type": self._classify_step(sentence)
-                })
-        
-        return steps
+                yield i, sentence
     
-    def _classify_step(self, step_content: str) -> str:
+    @staticmethod
+    def _classify_step(step_content: str) -> str:
         """Enhanced step classification based on content analysis."""
-        content_lower = step_content.lower()
-        
-        # Calculation indicators
-        if any(word in content_lower for word in ['calculate', 'multiply', 'divide', 'add', 'subtract', 
-                                                 'formula', 'equation', '=', '+', '-', '*', '/', '×', '÷']):
-            return "calculation"
-        
-        # Conclusion indicators
-        if any(word in content_lower for word in ['therefore', 'so', 'conclude', 'answer', 'result', 
-                                                 'thus', 'hence', 'finally', 'in conclusion', 'as a result']):
-            return "conclusion"
-        
-        # Assumption indicators
-        if any(word in content_lower for word in ['assume', 'given', 'known', 'fact', 'premise', 
-                                                 'suppose', 'let', 'if', 'since', 'because']):
-            return "assumption"
-        
-        # Analysis indicators
-        if any(word in content_lower for word in ['analyze', 'examine', 'consider', 'think', 'reason',
-                                                 'understand', 'identify', 'determine', 'find']):
-            return "analysis"
-        
-        # Default to reasoning
-        return "reasoning"
+        return _classify_step_cached(step_content)
     
     def get_generation_stats(self) -> Dict[str, any]:
         """Get statistics about the generation process."""
+        quantization = getattr(self.model_manager, "quantization", None)
         return {
             "max_length": self.max_length,
             "model_ready": self.model_manager.is_ready() if self.model_manager else False,
-            "model_info": self.model_manager.get_model_info() if self.model_manager else None
+            "model_info": self.model_manager.get_model_info() if self.model_manager else None,
+            "quantization_tradeoff": QUANTIZATION_TRADEOFFS.get(quantization)
         }
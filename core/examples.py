@@ -1,123 +1,132 @@
+import random
+from typing import Dict, Tuple
+
+def _index_problems(problems: Tuple[Dict[str, str], ...], field: str) -> Dict[str, Tuple[Dict[str, str], ...]]:
+    """Group problems by the value of one of their fields, keeping their order."""
+    index: Dict[str, list] = {}
+    for problem in problems:
+        index.setdefault(problem.get(field), []).append(problem)
+    return {value: tuple(group) for value, group in index.items()}
+
 class ExampleProblems:
     """Collection of example problems for different categories."""
     
-    def __init__(self):
-        self.math_problems = [
-            {
-                "question": "If a train leaves the station at 3 PM traveling at 60 mph and needs to cover 180 miles, what time will it arrive?",
-                "category": "time_distance",
-                "difficulty": "medium"
-            },
-            {
-                "question": "A store offers a 25% discount on a $80 item. What is the final price after a 8% sales tax is applied?",
-                "category": "percentage",
-                "difficulty": "medium"
-            },
-            {
-                "question": "If 3 workers can build a wall in 6 days, how many days will it take 9 workers to build the same wall?",
-                "category": "work_rate",
-                "difficulty": "medium"
-            },
-            {
-                "question": "What is 123 × 45?",
-                "category": "arithmetic",
-                "difficulty": "easy"
-            },
-            {
-                "question": "A rectangular garden is 15 feet long and 8 feet wide. If you want to put a fence around it, how many feet of fencing do you need?",
-                "category": "geometry",
-                "difficulty": "easy"
-            }
-        ]
+    # Example data is shared by every instance and never modified, so it is built once as tuples
+    MATH_PROBLEMS = (
+        {
+            "question": "If a train leaves the station at 3 PM traveling at 60 mph and needs to cover 180 miles, what time will it arrive?",
+            "category": "time_distance",
+            "difficulty": "medium"
+        },
+        {
+            "question": "A store offers a 25% discount on a $80 item. What is the final price after a 8% sales tax is applied?",
+            "category": "percentage",
+            "difficulty": "medium"
+        },
+        {
+            "question": "If 3 workers can build a wall in 6 days, how many days will it take 9 workers to build the same wall?",
+            "category": "work_rate",
+            "difficulty": "medium"
+        },
+        {
+            "question": "What is 123 × 45?",
+            "category": "arithmetic",
+            "difficulty": "easy"
+        },
+        {
+            "question": "A rectangular garden is 15 feet long and 8 feet wide. If you want to put a fence around it, how many feet of fencing do you need?",
+            "category": "geometry",
+            "difficulty": "easy"
+        }
+    )
         
-        self.logic_problems = [
-            {
-                "question": "Alice is taller than Bob. Bob is taller than Carol. Carol is taller than David. Who is the tallest?",
-                "category": "ordering",
-                "difficulty": "easy"
-            },
-            {
-                "question": "If all roses are flowers, and some flowers are red, can we conclude that some roses are red?",
-                "category": "logical_reasoning",
-                "difficulty": "medium"
-            },
-            {
-                "question": "In a race, Tom finished before Jerry, Jerry finished before Spike, and Spike finished before Tyke. If there were only these 4 participants, what was Jerry's position?",
-                "category": "ordering",
-                "difficulty": "easy"
-            },
-            {
-                "question": "Every student in the class passed the test. Sarah is in the class. Did Sarah pass the test?",
-                "category": "deduction",
-                "difficulty": "easy"
-            },
-            {
-                "question": "If it rains, then the ground gets wet. The ground is wet. Did it rain?",
-                "category": "logical_fallacy",
-                "difficulty": "medium"
-            }
-        ]
+    LOGIC_PROBLEMS = (
+        {
+            "question": "Alice is taller than Bob. Bob is taller than Carol. Carol is taller than David. Who is the tallest?",
+            "category": "ordering",
+            "difficulty": "easy"
+        },
+        {
+            "question": "If all roses are flowers, and some flowers are red, can we conclude that some roses are red?",
+            "category": "logical_reasoning",
+            "difficulty": "medium"
+        },
+        {
+            "question": "In a race, Tom finished before Jerry, Jerry finished before Spike, and Spike finished before Tyke. If there were only these 4 participants, what was Jerry's position?",
+            "category": "ordering",
+            "difficulty": "easy"
+        },
+        {
+            "question": "Every student in the class passed the test. Sarah is in the class. Did Sarah pass the test?",
+            "category": "deduction",
+            "difficulty": "easy"
+        },
+        {
+            "question": "If it rains, then the ground gets wet. The ground is wet. Did it rain?",
+            "category": "logical_fallacy",
+            "difficulty": "medium"
+        }
+    )
         
-        self.riddles = [
-            {
-                "question": "I have keys but no locks. I have space but no room. You can enter but not go outside. What am I?",
-                "category": "wordplay",
-                "difficulty": "medium"
-            },
-            {
-                "question": "What gets wetter as it dries?",
-                "category": "wordplay",
-                "difficulty": "easy"
-            },
-            {
-                "question": "I'm tall when I'm young and short when I'm old. What am I?",
-                "category": "metaphor",
-                "difficulty": "easy"
-            },
-            {
-                "question": "What has an eye but cannot see?",
-                "category": "wordplay",
-                "difficulty": "easy"
-            },
-            {
-                "question": "The more you take, the more you leave behind. What am I?",
-                "category": "wordplay",
-                "difficulty": "medium"
-            }
-        ]
+    RIDDLES = (
+        {
+            "question": "I have keys but no locks. I have space but no room. You can enter but not go outside. What am I?",
+            "category": "wordplay",
+            "difficulty": "medium"
+        },
+        {
+            "question": "What gets wetter as it dries?",
+            "category": "wordplay",
+            "difficulty": "easy"
+        },
+        {
+            "question": "I'm tall when I'm young and short when I'm old. What am I?",
+            "category": "metaphor",
+            "difficulty": "easy"
+        },
+        {
+            "question": "What has an eye but cannot see?",
+            "category": "wordplay",
+            "difficulty": "easy"
+        },
+        {
+            "question": "The more you take, the more you leave behind. What am I?",
+            "category": "wordplay",
+            "difficulty": "medium"
+        }
+    )
+    
+    ALL_PROBLEMS = MATH_PROBLEMS + LOGIC_PROBLEMS + RIDDLES
+    _BY_TYPE = {"math": MATH_PROBLEMS, "logic": LOGIC_PROBLEMS, "riddle": RIDDLES}
+    
+    # Filter lookups are indexed once instead of scanning every problem per call
+    _BY_CATEGORY = _index_problems(ALL_PROBLEMS, "category")
+    _BY_DIFFICULTY = _index_problems(ALL_PROBLEMS, "difficulty")
     
     def get_math_problems(self):
         """Get all math problems."""
-        return self.math_problems
+        return self.MATH_PROBLEMS
     
     def get_logic_problems(self):
         """Get all logic problems."""
-        return self.logic_problems
+        return self.LOGIC_PROBLEMS
     
     def get_riddles(self):
         """Get all riddles."""
-        return self.riddles
+        return self.RIDDLES
+    
+    def get_all_problems(self):
+        """Get all problems across every category."""
+        return self.ALL_PROBLEMS
     
     def get_problem_by_category(self, category: str):
         """Get problems by specific category."""
-        all_problems = self.math_problems + self.logic_problems + self.riddles
-        return [p for p in all_problems if p.get("category") == category]
+        return self._BY_CATEGORY.get(category, ())
     
     def get_problems_by_difficulty(self, difficulty: str):
         """Get problems by difficulty level."""
-        all_problems = self.math_problems + self.logic_problems + self.riddles
-        return [p for p in all_problems if p.get("difficulty") == difficulty]
+        return self._BY_DIFFICULTY.get(difficulty, ())
     
     def get_random_problem(self, problem_type=None):
         """Get a random problem, optionally filtered by type."""
-        import random
-        
-        if problem_type == "math":
-            return random.choice(self.math_problems)
-        elif problem_type == "logic":
-            return random.choice(self.logic_problems)
-        elif problem_type == "riddle":
-            return random.choice(self.riddles)
-        else:
-            all_problems = self.math_problems + self.logic_problems + self.riddles
-            return random.choice(all_problems)
+        return random.choice(self._BY_TYPE.get(problem_type, self.ALL_PROBLEMS))
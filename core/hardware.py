@@ -0,0 +1,20 @@
+import os
+
+# Supported weight formats: bitsandbytes on CUDA, OpenVINO weight-only on CPU
+QUANTIZATION_MODES = ("int8", "int4", "fp16")
+
+# Quality/speed tradeoff of each weight format; decoding is bound by the bytes of weight read per token
+QUANTIZATION_TRADEOFFS = {
+    "fp16": "Full-precision weights: best output quality, largest memory footprint and slowest decoding",
+    "int8": "8-bit weights: about half the memory traffic of fp16 per token, with negligible quality loss",
+    "int4": "4-bit weights: about a quarter of the memory traffic of fp16 per token, with a small quality loss"
+}
+
+def physical_cpu_count() -> int:
+    """Get the number of physical CPU cores, falling back to logical cores."""
+    try:
+        import psutil
+        count = psutil.cpu_count(logical=False)
+    except ImportError:
+        count = None
+    return count or os.cpu_count() or 1
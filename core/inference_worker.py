@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class InferenceWorker:
+    """Runs Chain of Thought generations on a background thread so Streamlit reruns don't interrupt them."""
+    
+    def __init__(self):
+        self._requests = queue.Queue()
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+        self._thread.start()
+    
+    def submit(self, cot_generator, problem: str, **sampling_kwargs) -> str:
+        """Queue a generation request and return its request id."""
+        request_id = uuid.uuid4().hex
+        
+        with self._lock:
+            self._results[request_id] = {
+                "status": "queued",
+                "chunks": [],
+                "error": None,
+                "generation_time": None,
+                "time_to_first_token": None
+            }
+        
+        self._requests.put((request_id, cot_generator, problem, sampling_kwargs))
+        logger.info(f"Queued generation request {request_id}")
+        
+        return request_id
+    
+    def get_result(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Get a snapshot of a request's status and the text generated so far."""
+        with self._lock:
+            result = self._results.get(request_id)
+            if result is None:
+                return None
+            
+            snapshot = {key: value for key, value in result.items() if key != "chunks"}
+            snapshot["response"] = "".join(result["chunks"])
+            return snapshot
+    
+    def cancel(self, request_id: str):
+        """Cancel a queued or running request; decoding stops at the next token."""
+        with self._lock:
+            result = self._results.get(request_id)
+            if result is not None and result["status"] in ("queued", "running"):
+                self._cancelled.add(request_id)
+    
+    def discard(self, request_id: str):
+        """Forget a request once its result has been consumed or is no longer wanted."""
+        # A cancelled request keeps its cancel mark until the worker has skipped or stopped it
+        with self._lock:
+            self._results.pop(request_id, None)
+    
+    def _is_cancelled(self, request_id: str) -> bool:
+        """Check whether a request has been cancelled."""
+        with self._lock:
+            return request_id in self._cancelled
+    
+    def _update(self, request_id: str, **fields):
+        """Update the stored result fields for a request."""
+        with self._lock:
+            if request_id in self._results:
+                self._results[request_id].update(fields)
+    
+    def _finish(self, request_id: str, **fields):
+        """Record a request's final fields and drop its cancel mark, as the worker is done with it."""
+        with self._lock:
+            self._cancelled.discard(request_id)
+            if request_id in self._results:
+                self._results[request_id].update(fields)
+    
+    def _run(self):
+        """Consume queued requests one at a time, streaming into the shared results."""
+        while True:
+            # Each request is handled in its own frame, so the generator and stream it referenced are released
+            # once it finishes instead of keeping an evicted model alive until the next request arrives
+            self._process(*self._requests.get())
+    
+    def _process(self, request_id: str, cot_generator, problem: str, sampling_kwargs: Dict[str, Any]):
+        """Run a single request, streaming its chunks into the shared results."""
+        if self._is_cancelled(request_id):
+            self._finish(request_id, status="cancelled")
+            return
+        
+        self._update(request_id, status="running")
+        start_time = time.time()
+        
+        try:
+            stream = cot_generator.generate_cot_stream(problem, **sampling_kwargs)
+            for chunk in stream:
+                if self._is_cancelled(request_id):
+                    # Closing the stream trips the model's stopping criteria
+                    stream.close()
+                    self._finish(request_id, status="cancelled")
+                    break
+                
+                with self._lock:
+                    result = self._results.get(request_id)
+                    if result is not None:
+                        if result["time_to_first_token"] is None:
+                            result["time_to_first_token"] = time.time() - start_time
+                        result["chunks"].append(chunk)
+            else:
+                self._finish(request_id, status="done", generation_time=time.time() - start_time)
+        
+        except Exception as e:
+            logger.error(f"Error in generation request {request_id}: {e}")
+            self._finish(request_id, status="error", error=str(e))
@@ -0,0 +1,25 @@
+import re
+from typing import Dict, List
+
+def keyword_alternation(keywords: List[str]) -> str:
+    """Join keywords into a regex alternation; word-like keywords only match whole words."""
+    return "|".join(
+        rf"\b{re.escape(keyword)}\b" if keyword[0].isalnum() and keyword[-1].isalnum() else re.escape(keyword)
+        for keyword in keywords
+    )
+
+def tagged_keyword_regex(categories: Dict[str, List[str]]) -> re.Pattern:
+    """Compile keyword lists, in priority order, into one regex whose named groups tag each hit."""
+    # The lookahead reports a hit at every position, so no keyword is hidden inside another match
+    groups = "|".join(f"(?P<{category}>{keyword_alternation(keywords)})" for category, keywords in categories.items())
+    return re.compile(f"(?=(?:{groups}))", re.IGNORECASE)
+
+def match_category(regex: re.Pattern, text: str, default: str) -> str:
+    """Get the highest-priority category with a keyword in the text, in a single scan."""
+    categories = list(regex.groupindex)
+    best = len(categories)
+    for match in regex.finditer(text):
+        best = min(best, categories.index(match.lastgroup))
+        if best == 0:
+            break
+    return categories[best] if best < len(categories) else default
@@ -1,13 +1,21 @@
 import streamlit as st
 import logging
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from transformers import (AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig,
+                          StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer)
 import re
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterator, Tuple
 import gc
 import os
+import copy
+import contextlib
+import functools
+import threading
 from dotenv import load_dotenv
 
+from core.hardware import QUANTIZATION_MODES, physical_cpu_count
+from core.keywords import tagged_keyword_regex, match_category
+
 # Load environment variables
 load_dotenv()
 
@@ -15,19 +23,127 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Problem type keywords used to pick the prompt guidance
+_PROBLEM_TYPE_RE = tagged_keyword_regex({
+    "math": ['calculate', 'solve', 'equation', 'multiply', 'divide', 'add', 'subtract', 
+             'percent', '%', 'fraction', 'decimal', 'number', 'sum', 'difference',
+             'mph', 'miles', 'hours', 'minutes', 'seconds', 'distance', 'time',
+             'workers', 'days', 'build', 'complete', 'fence', 'perimeter', 'area'],
+    "logic": ['if', 'then', 'either', 'or', 'all', 'some', 'none', 'always', 'never',
+              'taller', 'shorter', 'faster', 'slower', 'before', 'after', 'position',
+              'race', 'finished', 'student', 'passed', 'class', 'roses', 'flowers'],
+    "riddle": ['riddle', 'what am i', 'guess', 'mystery', 'puzzle', 'keys', 'locks',
+               'space', 'room', 'enter', 'outside', 'wetter', 'dries', 'young', 'old',
+               'eye', 'cannot see', 'take', 'leave behind']
+})
+
+@functools.lru_cache(maxsize=4096)
+def _detect_problem_type_cached(problem: str) -> str:
+    """Get the problem type for a problem string; repeated problems skip the keyword scan."""
+    return match_category(_PROBLEM_TYPE_RE, problem, "general")
+
+# Solution labels in a multiplexed response, e.g. "[2] "
+_MULTIPLEX_LABEL_RE = re.compile(r"\[(\d+)\]\s*")
+
+class _EventStoppingCriteria(StoppingCriteria):
+    """Stops generation as soon as the given threading event is set."""
+    
+    def __init__(self, event: threading.Event):
+        self.event = event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
 class ModelManager:
     """Manages Chain of Thought reasoning with actual Phi-2 model."""
     
-    def __init__(self, model_name="microsoft/phi-2", use_quantization=True, device=None):
+    QUANTIZATION_MODES = QUANTIZATION_MODES
+    
+    # Phi-2's positional range, which the prompt and its generated tokens share
+    CONTEXT_LENGTH = 2048
+    
+    # Static KV cache lengths under CUDA graphs; decode steps of calls in the same bucket replay the same compiled graphs
+    STATIC_CACHE_BUCKETS = (512, 1024, 2048, 4096)
+    
+    # Fraction of free VRAM below which cached allocator blocks are released after a generation
+    VRAM_HEADROOM = 0.10
+    
+    # Static instructions that open every CoT prompt
+    COT_SYSTEM_PROMPT = "You are an AI assistant that thinks through problems step by step. Always show your reasoning process clearly."
+    
+    # Problem-specific guidance, kept in the static prefix so each problem type has a fixed opening
+    PROBLEM_GUIDANCE = {
+        "math": "For this math problem, I'll break it down into clear steps, show my calculations, and verify my answer.",
+        "logic": "For this logic problem, I'll identify the key relationships, apply logical reasoning, and draw clear conclusions.",
+        "riddle": "For this riddle, I'll analyze the clues carefully, consider wordplay and metaphors, and think creatively.",
+        "general": "I'll approach this systematically, breaking it down into manageable parts and thinking through each step carefully."
+    }
+    
+    # Variable part of a CoT prompt, placed after the static prefix
+    COT_USER_TEMPLATE = """
+
+Problem: {problem}
+
+Let's think through this step by step:
+
+"""
+    
+    # Several problems packed into one prompt, each solution labelled with its [index]
+    MULTIPLEX_USER_TEMPLATE = """
+
+Solve each problem step by step. Label each solution with its [index].
+
+{problems}
+
+Let's think through each problem step by step:
+
+[1]"""
+    
+    # Each template split once around its placeholder, so building a prompt is plain concatenation
+    # (unpacking fails at import if a template doesn't have exactly one placeholder)
+    _COT_USER_PREFIX, _COT_USER_SUFFIX = COT_USER_TEMPLATE.split("{problem}")
+    _MULTIPLEX_USER_PREFIX, _MULTIPLEX_USER_SUFFIX = MULTIPLEX_USER_TEMPLATE.split("{problems}")
+    
+    def __init__(self, model_name="microsoft/phi-2", quantization=None, device=None, num_threads=None,
+                 draft_model_name=None, backend=None, cuda_graphs=False):
         self.model_name = model_name
-        self.use_quantization = use_quantization
+        # "vllm" serves the model through vLLM on CUDA; by default the backend follows device and quantization
+        self.requested_backend = backend
+        # Replay each decode step from a captured CUDA graph (static KV cache + torch.compile)
+        self.cuda_graphs = cuda_graphs
+        # Optional small model sharing the tokenizer, used to draft tokens for speculative decoding
+        self.draft_model_name = draft_model_name
         self.device = device or self._get_device()
+        self.num_threads = None
+        # Default to 4-bit NF4 on CUDA, INT8 weight-only on CPU and full precision on MPS, which has no quantized kernels
+        self.quantization = quantization or {"cuda": "int4", "mps": "fp16"}.get(self.device, "int8")
+        if self.quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {self.quantization}")
+        self.backend = None
         self.model = None
+        self.draft_model = None
         self.tokenizer = None
         self.model_loaded = False
+        # Set when IPEX prepacked the weights in bf16, whose kernels need CPU inference under bf16 autocast
+        self._cpu_autocast = False
+        # Parameter counts of the loaded PyTorch model, computed once since they never change
+        self._total_params: Optional[int] = None
+        self._trainable_params: Optional[int] = None
+        # Tokenized prompts for fixed problems, keyed by the full CoT prompt
+        self._encoding_cache: Dict[str, Dict[str, torch.Tensor]] = {}
+        # Static prefix for each problem type, built once so every prompt reuses the same string
+        self._system_prompts = {
+            problem_type: self.COT_SYSTEM_PROMPT + "\n\n" + guidance
+            for problem_type, guidance in self.PROBLEM_GUIDANCE.items()
+        }
+        # KV caches of the prefilled static prefixes, keyed by prefix text and copied into each generation
+        self._prefix_caches: Dict[str, Any] = {}
         
         logger.info(f"Initializing ModelManager for {model_name}")
-        logger.info(f"Device: {self.device}, Quantization: {use_quantization}")
+        logger.info(f"Device: {self.device}, Quantization: {self.quantization}")
+        
+        if self.device == "cpu":
+            self._configure_cpu_threads(num_threads)
         
         # Load the model
         self._load_model()
@@ -41,6 +157,21 @@ class ModelManager:
         else:
             return "cpu"
     
+    physical_cpu_count = staticmethod(physical_cpu_count)
+    
+    def _configure_cpu_threads(self, num_threads=None):
+        """Pin PyTorch's intra-op threads to the physical cores to avoid oversubscription."""
+        self.num_threads = num_threads or self.physical_cpu_count()
+        torch.set_num_threads(self.num_threads)
+        
+        try:
+            torch.set_num_interop_threads(2)
+        except RuntimeError:
+            # Inter-op threads can only be set once, before any parallel work has started
+            pass
+        
+        logger.info(f"Using {self.num_threads} CPU threads")
+    
     def _get_auth_token(self):
         """Get authentication token from environment variables."""
         token = os.getenv('HUGGINGFACE_TOKEN')
@@ -64,8 +195,12 @@ class ModelManager:
                 self.model_name,
                 trust_remote_code=True,
                 padding_side="left",
+                use_fast=True,
                 token=auth_token
             )
+            # The slow Python tokenizer would make tokenizing a batch a serial bottleneck
+            if not self.tokenizer.is_fast:
+                logger.warning(f"No fast tokenizer is available for {self.model_name}, tokenization will be slower")
             
             # Add padding token if not present
             if self.tokenizer.pad_token is None:
@@ -73,32 +208,21 @@ class ModelManager:
             
             logger.info("Loading model...")
             
-            # Configure quantization if requested
-            if self.use_quantization and self.device == "cuda":
-                quantization_config = BitsAndBytesConfig(
-                    load_in_4bit=True,
-                    bnb_4bit_compute_dtype=torch.float16,
-                    bnb_4bit_quant_type="nf4",
-                    bnb_4bit_use_double_quant=True
-                )
-                logger.info("Using 4-bit quantization")
+            # vLLM when requested, INT8/INT4 on CPU through OpenVINO, everything else through PyTorch
+            if self.requested_backend == "vllm" and self._vllm_available():
+                self._load_vllm_model(auth_token)
+            elif self.device == "cpu" and self.quantization != "fp16":
+                self._load_openvino_model(auth_token)
             else:
-                quantization_config = None
+                self._load_torch_model(auth_token)
             
-            # Load the model
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                torch_dtype=torch.float16 if self.device != "cpu" else torch.float32,
-                device_map="auto" if self.device == "cuda" else None,
-                quantization_config=quantization_config,
-                trust_remote_code=True,
-                low_cpu_mem_usage=True,
-                token=auth_token
-            )
+            if self.draft_model_name:
+                self._load_draft_model(auth_token)
             
-            # Move to device if not using device_map
-            if self.device != "cuda" or quantization_config is None:
-                self.model = self.model.to(self.device)
+            # OpenVINO and vLLM models don't expose torch parameters
+            if self.backend == "torch":
+                self._total_params = sum(p.numel() for p in self.model.parameters())
+                self._trainable_params = sum(p.numel() for p in self.model.parameters() if p.requires_grad)
             
             self.model_loaded = True
             logger.info(f"Model loaded successfully on {self.device}")
@@ -108,6 +232,200 @@ class ModelManager:
             self.model_loaded = False
             raise e
     
+    def _load_torch_model(self, auth_token):
+        """Load the model with PyTorch, quantizing through bitsandbytes on CUDA."""
+        # Configure quantization if requested
+        quantization_config = None
+        if self.device == "cuda" and self.quantization == "int4":
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=self._compute_dtype(),
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_use_double_quant=True
+            )
+            logger.info("Using 4-bit NF4 quantization")
+        elif self.device == "cuda" and self.quantization == "int8":
+            quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+            logger.info("Using 8-bit quantization")
+        elif self.quantization != "fp16":
+            logger.warning(f"{self.quantization} is not supported on {self.device}, loading full-precision weights")
+            self.quantization = "fp16"
+        
+        # Load the model
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            torch_dtype=self._compute_dtype(),
+            attn_implementation=self._attn_implementation(),
+            device_map="auto" if self.device == "cuda" else None,
+            quantization_config=quantization_config,
+            trust_remote_code=True,
+            low_cpu_mem_usage=True,
+            token=auth_token
+        )
+        
+        # Move to device if not using device_map, which already placed every weight on CUDA
+        if self.device != "cuda":
+            self.model = self.model.to(self.device)
+        
+        # Let oneDNN dispatch AMX/AVX512-BF16 kernels when IPEX is installed
+        if self.device == "cpu":
+            try:
+                import intel_extension_for_pytorch as ipex
+                self.model = ipex.optimize(self.model.eval(), dtype=torch.bfloat16)
+                self._cpu_autocast = True
+                logger.info("Optimized model with Intel Extension for PyTorch (bf16)")
+            except ImportError:
+                pass
+        
+        if self.cuda_graphs:
+            self._enable_cuda_graphs()
+        
+        self.backend = "torch"
+    
+    def _compute_dtype(self) -> torch.dtype:
+        """Get the dtype activations and the KV cache are computed in on the current device."""
+        if self.device == "cpu":
+            return torch.float32
+        # bf16 matches fp16 tensor-core throughput on Ampere and newer, and its wider range can't overflow the attention softmax
+        # The KV cache is deliberately kept in bf16 too rather than stored as fp16: both take 2 bytes per element, so fp16
+        # storage would not reduce decode memory traffic, and fused attention needs keys and values in the query's dtype
+        if self.device == "cuda" and torch.cuda.is_bf16_supported():
+            return torch.bfloat16
+        return torch.float16
+    
+    def _attn_implementation(self) -> str:
+        """Get the fused attention kernel to load the model with."""
+        # Both kernels compute attention in tiles without materializing the full attention matrix;
+        # FlashAttention-2 needs a CUDA device, half precision and the flash-attn package, and stays on the
+        # dynamic-cache path, since it can reject a StaticCache or graph-break under fullgraph compilation
+        if self.device == "cuda" and not self.cuda_graphs:
+            try:
+                import flash_attn  # noqa: F401
+                return "flash_attention_2"
+            except ImportError:
+                pass
+        return "sdpa"
+    
+    def _enable_cuda_graphs(self):
+        """Compile the forward pass over a static KV cache so decode steps replay a captured CUDA graph."""
+        # Every decode step runs the same kernels on the same shapes, so launching them is pure overhead
+        if self.device != "cuda" or self.quantization != "fp16":
+            logger.warning("CUDA graphs need full-precision weights on a CUDA device, decoding eagerly")
+            self.cuda_graphs = False
+            return
+        
+        try:
+            from transformers import StaticCache  # noqa: F401
+        except ImportError:
+            logger.warning("This transformers version has no static KV cache, decoding eagerly")
+            self.cuda_graphs = False
+            return
+        
+        # A preallocated cache keeps tensor shapes fixed from step to step, which graph capture requires;
+        # each generate call gets one from _static_cache_kwargs
+        # Each cache bucket and batch size compiles its own decode graph and each prompt length its own prefill,
+        # which the default recompile limit would cut off
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 64)
+        self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=True)
+        logger.info("Compiled the decode step for CUDA graph replay")
+    
+    def _load_draft_model(self, auth_token):
+        """Load the draft model used for speculative (assisted) decoding."""
+        # vLLM loads the draft model into its own engine (see _load_vllm_model)
+        if self.backend == "vllm":
+            return
+        
+        # Assisted generation drives both models through transformers' generate loop
+        if self.backend != "torch":
+            logger.warning(f"Speculative decoding needs the PyTorch backend, ignoring draft model {self.draft_model_name}")
+            return
+        
+        logger.info(f"Loading draft model {self.draft_model_name}...")
+        self.draft_model = AutoModelForCausalLM.from_pretrained(
+            self.draft_model_name,
+            torch_dtype=self._compute_dtype(),
+            attn_implementation=self._attn_implementation(),
+            trust_remote_code=True,
+            low_cpu_mem_usage=True,
+            token=auth_token
+        ).to(self.device)
+    
+    def _load_openvino_model(self, auth_token):
+        """Load the model through OpenVINO with INT8/INT4 weight-only compression."""
+        # CPU decode is memory-bandwidth bound, so fewer weight bytes per token means
+        # faster tokens, and OpenVINO runs the int8 matmuls on VNNI kernels
+        try:
+            from optimum.intel import OVModelForCausalLM, OVWeightQuantizationConfig
+        except ImportError:
+            logger.warning("optimum-intel is not installed, falling back to full-precision PyTorch on CPU")
+            self.quantization = "fp16"
+            self._load_torch_model(auth_token)
+            return
+        
+        bits = 8 if self.quantization == "int8" else 4
+        logger.info(f"Using OpenVINO {bits}-bit weight-only quantization")
+        
+        self.model = OVModelForCausalLM.from_pretrained(
+            self.model_name,
+            export=True,
+            quantization_config=OVWeightQuantizationConfig(bits=bits, group_size=128),
+            ov_config={
+                "PERFORMANCE_HINT": "LATENCY",
+                "INFERENCE_PRECISION_HINT": "f32",
+                "INFERENCE_NUM_THREADS": self.num_threads,
+                "CACHE_DIR": "model_cache"
+            },
+            trust_remote_code=True,
+            token=auth_token
+        )
+        
+        self.backend = "openvino"
+    
+    def _vllm_available(self) -> bool:
+        """Check whether the vLLM backend can serve this configuration."""
+        if self.device != "cuda":
+            logger.warning(f"vLLM needs a CUDA device, falling back to the default backend on {self.device}")
+            return False
+        
+        try:
+            import vllm  # noqa: F401
+        except ImportError:
+            logger.warning("vLLM is not installed, falling back to the default backend")
+            return False
+        
+        return True
+    
+    def _load_vllm_model(self, auth_token):
+        """Load the model into a vLLM engine with paged attention, continuous batching and prefix caching."""
+        from vllm import LLM
+        
+        # vLLM quantizes 4-bit weights in flight through bitsandbytes
+        quantization = "bitsandbytes" if self.quantization == "int4" else None
+        if self.quantization == "int8":
+            logger.warning("int8 is not supported by the vLLM backend, loading full-precision weights")
+            self.quantization = "fp16"
+        
+        # vLLM downloads gated checkpoints with the standard Hugging Face token variable
+        os.environ.setdefault("HF_TOKEN", auth_token)
+        
+        self.model = LLM(
+            model=self.model_name,
+            dtype="float16",
+            quantization=quantization,
+            gpu_memory_utilization=0.9,
+            max_num_seqs=64,
+            max_model_len=self.CONTEXT_LENGTH,
+            enable_prefix_caching=True,
+            # Long prompts are prefilled in chunks scheduled alongside running decodes, so they don't stall them
+            enable_chunked_prefill=True,
+            max_num_batched_tokens=4096,
+            # The draft model proposes tokens that the engine verifies in one batched forward pass
+            speculative_config={"model": self.draft_model_name, "num_speculative_tokens": 4} if self.draft_model_name else None,
+            trust_remote_code=True
+        )
+        
+        self.backend = "vllm"
+    
     def generate_response(self, prompt: str, max_length: int = 1024, temperature: float = 0.3, 
                          do_sample: bool = True, top_p: float = 0.9, top_k: int = 50) -> str:
         """Generate a real Chain of Thought response using the loaded model."""
@@ -115,107 +433,365 @@ class ModelManager:
             raise RuntimeError("Model not loaded. Please initialize the model first.")
         
         try:
-            # Create Chain of Thought prompt
-            cot_prompt = self._create_cot_prompt(prompt)
+            # Create Chain of Thought prompt as (static prefix, problem text)
+            cot_prompt = self._create_cot_prompt_parts(prompt)
             
             logger.info(f"Generating response with max_length={max_length}, temperature={temperature}")
             
-            # Tokenize input
+            response = self._generate_completion(*cot_prompt, max_length, temperature, do_sample, top_p, top_k)
+            
+            logger.info(f"Generated response length: {len(response)} characters")
+            
+            return response
+            
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            raise e
+    
+    def generate_response_multiplex(self, prompts: List[str], max_length: int = 1024, temperature: float = 0.3,
+                                    do_sample: bool = True, top_p: float = 0.9, top_k: int = 50) -> List[str]:
+        """Solve several problems in one prompt and one generation, split back into one response per problem."""
+        if not self.model_loaded or self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded. Please initialize the model first.")
+        
+        try:
+            multiplex_prompt = self._create_multiplex_prompt_parts(prompts)
+            
+            # The scaled-up budget for every solution still has to fit in the context after the prompt
+            prompt_length = len(self.tokenizer("".join(multiplex_prompt))["input_ids"])
+            if prompt_length >= self.CONTEXT_LENGTH:
+                raise ValueError(f"Multiplexed prompt of {prompt_length} tokens leaves no room in the {self.CONTEXT_LENGTH}-token context")
+            max_length = min(max_length, self.CONTEXT_LENGTH - prompt_length)
+            
+            logger.info(f"Generating multiplexed response for {len(prompts)} problems with max_length={max_length}, temperature={temperature}")
+            
+            # The prompt ends with the first label, so put it back before splitting on labels
+            response = self._generate_completion(*multiplex_prompt, max_length, temperature, do_sample, top_p, top_k)
+            parts = _MULTIPLEX_LABEL_RE.split("[1] " + response)
+            
+            # parts alternates label numbers and solution text; keep the first solution for each label
+            responses = [""] * len(prompts)
+            for label, text in zip(parts[1::2], parts[2::2]):
+                index = int(label) - 1
+                if 0 <= index < len(prompts) and not responses[index]:
+                    responses[index] = text.strip()
+            
+            logger.info(f"Split multiplexed response into {sum(1 for r in responses if r)} of {len(prompts)} solutions")
+            
+            return responses
+        
+        except Exception as e:
+            logger.error(f"Error generating multiplexed response: {e}")
+            raise e
+    
+    def _generate_completion(self, system: str, user: str, max_length: int, temperature: float,
+                             do_sample: bool, top_p: float, top_k: int) -> str:
+        """Run one generate call for a prompt and return only the newly generated text."""
+        if self.backend == "vllm":
+            return self._vllm_generate([system + user], max_length, temperature, do_sample, top_p, top_k)[0]
+        
+        # Tokenize input
+        inputs = self._encode_prompt(system, user)
+        
+        # Generate response
+        with self._inference_context():
+            outputs = self.model.generate(
+                **inputs,
+                **self._prefix_cache_kwargs(system),
+                **self._assisted_kwargs(),
+                **self._static_cache_kwargs(inputs["input_ids"], max_length),
+                **self._generation_kwargs(max_length, temperature, do_sample, top_p, top_k)
+            )
+        
+        # Decode only the generated tokens, which follow the prompt's tokens in the output
+        prompt_length = inputs["input_ids"].shape[1]
+        response = self.tokenizer.decode(outputs[0, prompt_length:], skip_special_tokens=True).strip()
+        self._release_cache_if_low_memory()
+        return response
+    
+    def stream_response(self, prompt: str, max_length: int = 1024, temperature: float = 0.3,
+                        do_sample: bool = True, top_p: float = 0.9, top_k: int = 50) -> Iterator[str]:
+        """Stream a Chain of Thought response, yielding text chunks as tokens are decoded."""
+        if not self.model_loaded or self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded. Please initialize the model first.")
+        
+        system, user = self._create_cot_prompt_parts(prompt)
+        
+        logger.info(f"Streaming response with max_length={max_length}, temperature={temperature}")
+        
+        # The offline vLLM engine returns finished sequences only, so the response arrives as a single chunk
+        if self.backend == "vllm":
+            yield self._generate_completion(system, user, max_length, temperature, do_sample, top_p, top_k)
+            return
+        
+        inputs = self._encode_prompt(system, user)
+        prefix_kwargs = self._prefix_cache_kwargs(system)
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop_event = threading.Event()
+        errors = []
+        
+        def run_generation():
+            try:
+                with self._inference_context():
+                    self.model.generate(
+                        **inputs,
+                        streamer=streamer,
+                        **prefix_kwargs,
+                        **self._assisted_kwargs(),
+                        stopping_criteria=StoppingCriteriaList([_EventStoppingCriteria(stop_event)]),
+                        **self._static_cache_kwargs(inputs["input_ids"], max_length),
+                        **self._generation_kwargs(max_length, temperature, do_sample, top_p, top_k)
+                    )
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer, which would otherwise wait on the streamer forever
+                streamer.end()
+        
+        thread = threading.Thread(target=run_generation, daemon=True)
+        thread.start()
+        
+        try:
+            for chunk in streamer:
+                yield chunk
+        finally:
+            # Stop decoding early if the consumer goes away (e.g. a Streamlit rerun)
+            stop_event.set()
+            thread.join()
+            self._release_cache_if_low_memory()
+        
+        if errors:
+            logger.error(f"Error streaming response: {errors[0]}")
+            raise errors[0]
+    
+    def generate_response_batch(self, prompts: List[str], max_length: int = 1024, temperature: float = 0.3,
+                                do_sample: bool = True, top_p: float = 0.9, top_k: int = 50) -> List[str]:
+        """Generate Chain of Thought responses for several prompts in a single batched call."""
+        if not self.model_loaded or self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded. Please initialize the model first.")
+        
+        try:
+            cot_prompts = [self._create_cot_prompt(prompt) for prompt in prompts]
+            
+            logger.info(f"Generating batch of {len(prompts)} responses with max_length={max_length}, temperature={temperature}")
+            
+            # vLLM schedules the prompts itself with continuous batching, without padding them to one length
+            if self.backend == "vllm":
+                responses = self._vllm_generate(cot_prompts, max_length, temperature, do_sample, top_p, top_k)
+                logger.info(f"Generated {len(responses)} batched responses")
+                return responses
+            
+            # Tokenize as one padded batch; the tokenizer pads on the left so every
+            # prompt ends right where its generated tokens begin
             inputs = self.tokenizer(
-                cot_prompt,
+                cot_prompts,
                 return_tensors="pt",
                 padding=True,
                 truncation=True,
-                max_length=2048  # Increased input length limit
+                max_length=2048
             ).to(self.device)
             
-            # Generate response
-            with torch.no_grad():
+            # One generate call amortizes weight reads across the whole batch
+            with self._inference_context():
                 outputs = self.model.generate(
                     **inputs,
-                    max_new_tokens=max_length,
-                    temperature=temperature,
-                    do_sample=do_sample,
-                    top_p=top_p,
-                    top_k=top_k,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.1,
-                    length_penalty=1.0,
-                    # Remove early_stopping to avoid warnings when num_beams=1
-                    num_beams=1
+                    **self._static_cache_kwargs(inputs["input_ids"], max_length),
+                    **self._generation_kwargs(max_length, temperature, do_sample, top_p, top_k)
                 )
             
-            # Decode response
-            generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            # All rows share the padded prompt length, so the new tokens start at the same index
+            prompt_length = inputs["input_ids"].shape[1]
+            responses = [
+                response.strip()
+                for response in self.tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+            ]
             
-            # Extract only the generated part (remove the input prompt)
-            response = generated_text[len(cot_prompt):].strip()
+            self._release_cache_if_low_memory()
+            logger.info(f"Generated {len(responses)} batched responses")
             
-            logger.info(f"Generated response length: {len(response)} characters")
-            
-            return response
+            return responses
             
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
+            logger.error(f"Error generating batched responses: {e}")
             raise e
     
+    @contextlib.contextmanager
+    def _inference_context(self):
+        """Run model calls without autograd tracking, under bf16 autocast when IPEX packed the weights in bf16."""
+        # Autocast casts the fp32 embeddings and activations to bf16 to match the prepacked weights
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=self._cpu_autocast):
+            yield
+    
+    def _release_cache_if_low_memory(self):
+        """Return cached CUDA blocks to the driver when little VRAM is left free."""
+        # Emptying the cache after every call would force fresh cudaMallocs, so only do it under memory pressure;
+        # vLLM preallocates its KV cache and manages that memory itself
+        if self.device != "cuda" or self.backend != "torch":
+            return
+        free, total = torch.cuda.mem_get_info()
+        if free / total < self.VRAM_HEADROOM:
+            torch.cuda.empty_cache()
+    
+    def warm_prompt_cache(self, problems: List[str]):
+        """Pre-tokenize fixed problems (e.g. the built-in examples) so generating them skips the tokenizer."""
+        if self.tokenizer is None:
+            return
+        
+        for problem in problems:
+            system, user = self._create_cot_prompt_parts(problem)
+            self._encoding_cache[system + user] = self._tokenize(system, user)
+        
+        logger.info(f"Cached tokenized prompts for {len(problems)} problems")
+    
+    def warm_prefix_cache(self):
+        """Prefill every static prompt prefix up front, so no generation pays for its first use."""
+        if not self._prefix_caching_enabled():
+            return
+        
+        for system in self._static_prefixes():
+            if system not in self._prefix_caches:
+                self._prefill_prefix(system)
+        
+        logger.info(f"Prefilled KV caches for {len(self._prefix_caches)} static prompt prefixes")
+    
+    def _static_prefixes(self) -> List[str]:
+        """Get every static prefix a prompt can start with: the bare system prompt and one per problem type."""
+        return [self.COT_SYSTEM_PROMPT] + list(self._system_prompts.values())
+        
+    def _prefix_caching_enabled(self) -> bool:
+        """Check whether generations can start from a prefilled prefix cache."""
+        # OpenVINO keeps its KV cache inside the compiled graph and vLLM caches prefixes itself, while
+        # assisted generation would have to prefill the draft model's cache alongside the main one and
+        # CUDA graphs decode into a preallocated static cache
+        return self.model_loaded and self.backend == "torch" and self.draft_model is None and not self.cuda_graphs
+    
+    def _prefill_prefix(self, system: str):
+        """Run the prefill pass for a static prefix and keep its KV cache."""
+        prefix_ids = self.tokenizer(system, return_tensors="pt")["input_ids"].to(self.device)
+        
+        with self._inference_context():
+            outputs = self.model(input_ids=prefix_ids, use_cache=True)
+        
+        self._prefix_caches[system] = outputs.past_key_values
+        return outputs.past_key_values
+    
+    def _prefix_cache_kwargs(self, system: str) -> Dict[str, Any]:
+        """Get a copy of the KV cache for a static prefix, prefilling it on first use."""
+        if not self._prefix_caching_enabled():
+            return {}
+        
+        prefix_cache = self._prefix_caches.get(system)
+        if prefix_cache is None:
+            prefix_cache = self._prefill_prefix(system)
+        
+        # generate() appends to the cache in place, so each request gets its own copy
+        return {"past_key_values": copy.deepcopy(prefix_cache)}
+    
+    def _tokenize(self, system: str, user: str) -> Dict[str, torch.Tensor]:
+        """Tokenize a prompt into CPU tensors, with the static prefix tokenized on its own."""
+        # Tokenizing the prefix separately keeps its ids identical across prompts, matching the prefilled cache
+        input_ids = self.tokenizer(system)["input_ids"] + self.tokenizer(user, add_special_tokens=False)["input_ids"]
+        input_ids = torch.tensor([input_ids[:2048]])  # Increased input length limit
+        encoding = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        # Pinned host memory lets the copy to the GPU run asynchronously
+        if self.device == "cuda":
+            encoding = {key: value.pin_memory() for key, value in encoding.items()}
+        return encoding
+    
+    def _encode_prompt(self, system: str, user: str) -> Dict[str, torch.Tensor]:
+        """Get model inputs for a prompt on the model device, reusing cached tokenization."""
+        encoding = self._encoding_cache.get(system + user)
+        if encoding is None:
+            encoding = self._tokenize(system, user)
+        return {key: value.to(self.device, non_blocking=True) for key, value in encoding.items()}
+    
+    def _vllm_generate(self, prompts: List[str], max_length: int, temperature: float, do_sample: bool,
+                       top_p: float, top_k: int) -> List[str]:
+        """Generate completions for prompts through the vLLM engine."""
+        from vllm import SamplingParams
+        
+        sampling_params = SamplingParams(
+            max_tokens=max_length,
+            # vLLM decodes greedily at temperature 0
+            temperature=max(temperature, 0.0) if do_sample else 0.0,
+            top_p=top_p,
+            top_k=top_k,
+            repetition_penalty=1.1
+        )
+        
+        outputs = self.model.generate(prompts, sampling_params, use_tqdm=False)
+        return [output.outputs[0].text.strip() for output in outputs]
+    
+    def _assisted_kwargs(self) -> Dict[str, Any]:
+        """Get the arguments that turn on speculative decoding when a draft model is loaded."""
+        # The draft model proposes several tokens that the main model verifies in one forward pass,
+        # which pays off most on long, low-temperature reasoning where most drafts are accepted
+        if self.draft_model is None:
+            return {}
+        return {"assistant_model": self.draft_model}
+    
+    def _static_cache_kwargs(self, input_ids: torch.Tensor, max_length: int) -> Dict[str, Any]:
+        """Get a static KV cache for a call, with its length rounded up to a fixed bucket."""
+        # Sized to each call, the cache would change shape with every prompt and force a decode-step recompile;
+        # the prefill still sees each prompt's own length, so a new prompt length compiles or records its prefill.
+        # A fresh cache per call matches what generate() allocates itself (reset caches break the compiled prefill)
+        if not self.cuda_graphs:
+            return {}
+        from transformers import StaticCache
+        
+        batch_size, prompt_length = input_ids.shape
+        needed = prompt_length + max_length
+        bucket = next((length for length in self.STATIC_CACHE_BUCKETS if needed <= length), needed)
+        
+        cache = StaticCache(config=self.model.config, max_batch_size=batch_size, max_cache_len=bucket,
+                            device=self.device, dtype=self.model.dtype)
+        return {"past_key_values": cache}
+    
+    def _generation_kwargs(self, max_length: int, temperature: float, do_sample: bool,
+                           top_p: float, top_k: int) -> Dict[str, Any]:
+        """Build the sampling arguments shared by all generate calls."""
+        # Temperature 0 means greedy decoding: an argmax over the logits, with no softmax or sampling
+        if temperature <= 0:
+            do_sample = False
+        
+        # Sampling parameters are only passed when sampling, as greedy decoding would warn about them
+        sampling_kwargs = {"temperature": temperature, "top_p": top_p, "top_k": top_k} if do_sample else {}
+        
+        return {
+            "max_new_tokens": max_length,
+            "do_sample": do_sample,
+            **sampling_kwargs,
+            "pad_token_id": self.tokenizer.eos_token_id,
+            "eos_token_id": self.tokenizer.eos_token_id,
+            # Reuse cached keys/values for earlier tokens, whatever the model config defaults to
+            "use_cache": True,
+            "repetition_penalty": 1.1,
+            "length_penalty": 1.0,
+            # Remove early_stopping to avoid warnings when num_beams=1
+            "num_beams": 1
+        }
+    
     def _create_cot_prompt(self, problem: str) -> str:
         """Create an optimized Chain of Thought prompt for the given problem."""
+        return "".join(self._create_cot_prompt_parts(problem))
+    
+    def _create_cot_prompt_parts(self, problem: str) -> Tuple[str, str]:
+        """Split the CoT prompt into its static prefix (system prompt and guidance) and the problem text."""
         problem_type = self._detect_problem_type(problem)
+        return self._system_prompt(problem_type), self._COT_USER_PREFIX + problem + self._COT_USER_SUFFIX
         
-        # Base CoT prompt template
-        base_prompt = """You are an AI assistant that thinks through problems step by step. Always show your reasoning process clearly.
-
-Problem: {problem}
-
-Let's think through this step by step:
-
-"""
-        
-        # Add problem-specific guidance
-        if problem_type == "math":
-            guidance = "For this math problem, I'll break it down into clear steps, show my calculations, and verify my answer."
-        elif problem_type == "logic":
-            guidance = "For this logic problem, I'll identify the key relationships, apply logical reasoning, and draw clear conclusions."
-        elif problem_type == "riddle":
-            guidance = "For this riddle, I'll analyze the clues carefully, consider wordplay and metaphors, and think creatively."
-        else:
-            guidance = "I'll approach this systematically, breaking it down into manageable parts and thinking through each step carefully."
+    def _system_prompt(self, problem_type: str) -> str:
+        """Get the static prefix for a problem type."""
+        return self._system_prompts[problem_type]
         
-        # Combine everything
-        full_prompt = base_prompt.format(problem=problem) + guidance + "\n\n"
-        
-        return full_prompt
+    def _create_multiplex_prompt_parts(self, problems: List[str]) -> Tuple[str, str]:
+        """Create a single prompt that lists every problem under its [index] label."""
+        numbered = "\n".join(f"[{i}] {problem}" for i, problem in enumerate(problems, 1))
+        return self.COT_SYSTEM_PROMPT, self._MULTIPLEX_USER_PREFIX + numbered + self._MULTIPLEX_USER_SUFFIX
     
     def _detect_problem_type(self, problem: str) -> str:
         """Detect the type of problem to optimize prompting."""
-        problem_lower = problem.lower()
-        
-        # Math keywords
-        math_keywords = ['calculate', 'solve', 'equation', 'multiply', 'divide', 'add', 'subtract', 
-                        'percent', '%', 'fraction', 'decimal', 'number', 'sum', 'difference',
-                        'mph', 'miles', 'hours', 'minutes', 'seconds', 'distance', 'time',
-                        'workers', 'days', 'build', 'complete', 'fence', 'perimeter', 'area']
-        
-        # Logic keywords
-        logic_keywords = ['if', 'then', 'either', 'or', 'all', 'some', 'none', 'always', 'never',
-                         'taller', 'shorter', 'faster', 'slower', 'before', 'after', 'position',
-                         'race', 'finished', 'student', 'passed', 'class', 'roses', 'flowers']
-        
-        # Riddle keywords
-        riddle_keywords = ['riddle', 'what am i', 'guess', 'mystery', 'puzzle', 'keys', 'locks',
-                          'space', 'room', 'enter', 'outside', 'wetter', 'dries', 'young', 'old',
-                          'eye', 'cannot see', 'take', 'leave behind']
-        
-        if any(keyword in problem_lower for keyword in math_keywords):
-            return "math"
-        elif any(keyword in problem_lower for keyword in logic_keywords):
-            return "logic"
-        elif any(keyword in problem_lower for keyword in riddle_keywords):
-            return "riddle"
-        else:
-            return "general"
+        return _detect_problem_type_cached(problem)
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get comprehensive information about the loaded model."""
@@ -224,34 +800,72 @@ Let's think through this step by step:
                 "name": "No model loaded",
                 "device": "N/A",
                 "quantized": False,
+                "quantization": "N/A",
+                "backend": "N/A",
                 "parameters": "N/A",
                 "status": "Not loaded"
             }
         
-        # Get model parameters count
-        total_params = sum(p.numel() for p in self.model.parameters())
-        trainable_params = sum(p.numel() for p in self.model.parameters() if p.requires_grad)
+        # Parameter counts are computed at load time (OpenVINO and vLLM models don't expose torch parameters)
+        if self._total_params is not None:
+            total_params = f"{self._total_params:,}"
+            trainable_params = f"{self._trainable_params:,}"
+        else:
+            total_params = trainable_params = "N/A"
         
         return {
             "name": self.model_name,
             "device": self.device,
-            "quantized": self.use_quantization,
-            "total_parameters": f"{total_params:,}",
-            "trainable_parameters": f"{trainable_params:,}",
+            "quantized": self.quantization != "fp16",
+            "quantization": self.quantization,
+            "weight_bits": self._weight_bits(),
+            "kv_dtype": self._kv_dtype(),
+            "backend": self.backend,
+            "cpu_threads": self.num_threads,
+            "cuda_graphs": self.cuda_graphs,
+            "draft_model": self.draft_model_name if self.draft_model is not None or self.backend == "vllm" else None,
+            "total_parameters": total_params,
+            "trainable_parameters": trainable_params,
             "status": "Loaded and ready",
             "model_type": "Phi-2 (2.7B parameters)"
         }
     
+    def _weight_bits(self) -> int:
+        """Get the bit width the weights are actually stored in."""
+        if self.quantization != "fp16":
+            return 8 if self.quantization == "int8" else 4
+        if self.backend == "vllm":
+            return 16
+        # Full-precision weights are fp16 on accelerators, but fp32 (or bf16 with IPEX) on CPU
+        return next(self.model.parameters()).element_size() * 8
+    
+    def _kv_dtype(self) -> str:
+        """Get the dtype the KV cache is stored in, which follows the attention compute dtype (see _compute_dtype)."""
+        if self.backend == "openvino":
+            return "fp32"  # Set by INFERENCE_PRECISION_HINT
+        if self.backend == "vllm":
+            return "fp16"
+        return {torch.float16: "fp16", torch.bfloat16: "bf16", torch.float32: "fp32"}.get(self.model.dtype, str(self.model.dtype))
+    
     def cleanup(self):
         """Clean up model resources to free memory."""
         if self.model is not None:
             del self.model
             self.model = None
         
+        if self.draft_model is not None:
+            del self.draft_model
+            self.draft_model = None
+        
         if self.tokenizer is not None:
             del self.tokenizer
             self.tokenizer = None
         
+        self._encoding_cache.clear()
+        self._prefix_caches.clear()
+        self._total_params = self._trainable_params = None
+        self._cpu_autocast = False
+        
         # Clear CUDA cache if available
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -0,0 +1 @@
+"""Streamlit and Plotly visualizations of reasoning steps."""
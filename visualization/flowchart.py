@@ -1,6 +1,7 @@
 import plotly.graph_objects as go
 import plotly.express as px
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from collections import Counter
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,10 @@ class FlowchartGenerator:
         }
         
         self.default_color = "#9E9E9E"  # Gray
+        
+        # Placeholder figures never change, so each is built on first use and then shared
+        self._empty_fig = None
+        self._error_fig = None
     
     def create_flowchart(self, steps: List[Dict[str, str]]):
         """Create a flowchart visualization of the reasoning steps."""
@@ -25,44 +30,30 @@ class FlowchartGenerator:
                 return self._create_empty_chart()
             
             # Prepare data for visualization
+            step_types, step_contents = self._step_columns(steps)
             x_positions = list(range(len(steps)))
             y_positions = [0] * len(steps)  # All on same level for simplicity
             
-            # Extract step information
-            step_texts = []
-            step_colors = []
-            step_sizes = []
-            
-            for step in steps:
-                content = step.get("content", "")
-                step_type = step.get("type", "reasoning")
-                
-                # Truncate text for display
-                display_text = self._truncate_text(content, max_length=30)
-                step_texts.append(display_text)
-                
-                # Assign color based on step type
-                color = self.step_colors.get(step_type, self.default_color)
-                step_colors.append(color)
-                
-                # Size based on content length (within reasonable bounds)
-                size = min(max(len(content) / 10 + 20, 25), 50)
-                step_sizes.append(size)
+            # Truncate text for display and assign colors based on step type
+            step_texts = [self._truncate_text(content, max_length=30) for content in step_contents]
+            step_colors = [self.step_colors.get(step_type, self.default_color) for step_type in step_types]
+            
+            # Size based on content length (within reasonable bounds)
+            step_sizes = [min(max(len(content) / 10 + 20, 25), 50) for content in step_contents]
             
             # Create the figure
             fig = go.Figure()
             
-            # Add connecting lines between steps
+            # Connect the steps with a single polyline rather than one trace per segment
             if len(steps) > 1:
-                for i in range(len(steps) - 1):
-                    fig.add_trace(go.Scatter(
-                        x=[x_positions[i], x_positions[i + 1]],
-                        y=[y_positions[i], y_positions[i + 1]],
-                        mode='lines',
-                        line=dict(color='gray', width=2),
-                        showlegend=False,
-                        hoverinfo='skip'
-                    ))
+                fig.add_trace(go.Scatter(
+                    x=x_positions,
+                    y=y_positions,
+                    mode='lines',
+                    line=dict(color='gray', width=2),
+                    showlegend=False,
+                    hoverinfo='skip'
+                ))
             
             # Add step nodes
             fig.add_trace(go.Scatter(
@@ -114,10 +105,8 @@ class FlowchartGenerator:
                 return self._create_empty_chart()
             
             # Count step types
-            step_counts = {}
-            for step in steps:
-                step_type = step.get("type", "reasoning")
-                step_counts[step_type] = step_counts.get(step_type, 0) + 1
+            step_types, _ = self._step_columns(steps)
+            step_counts = Counter(step_types)
             
             # Create pie chart
             fig = go.Figure(data=[go.Pie(
@@ -147,8 +136,8 @@ class FlowchartGenerator:
             
             # Prepare timeline data
             step_numbers = list(range(1, len(steps) + 1))
-            step_types = [step.get("type", "reasoning") for step in steps]
-            step_contents = [self._truncate_text(step.get("content", ""), 50) for step in steps]
+            step_types, step_contents = self._step_columns(steps)
+            step_contents = [self._truncate_text(content, 50) for content in step_contents]
             
             # Create bar chart
             fig = go.Figure(data=[go.Bar(
@@ -175,6 +164,12 @@ class FlowchartGenerator:
             logger.error(f"Error creating timeline: {e}")
             return self._create_error_chart()
     
+    def _step_columns(self, steps: List[Dict[str, str]]) -> Tuple[List[str], List[str]]:
+        """Extract the step types and contents as parallel lists."""
+        step_types = [step.get("type", "reasoning") for step in steps]
+        step_contents = [step.get("content", "") for step in steps]
+        return step_types, step_contents
+    
     def _truncate_text(self, text: str, max_length: int = 50) -> str:
         """Truncate text to specified length with ellipsis."""
         if len(text) <= max_length:
@@ -182,32 +177,26 @@ class FlowchartGenerator:
         return text[:max_length - 3] + "..."
     
     def _create_empty_chart(self):
-        """Create an empty chart with a message."""
-        fig = go.Figure()
-        fig.add_annotation(
-            text="No steps to visualize",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5,
-            showarrow=False,
-            font=dict(size=16, color="gray")
-        )
-        fig.update_layout(
-            height=300,
-            margin=dict(l=20, r=20, t=40, b=20),
-            xaxis=dict(showgrid=False, showticklabels=False, zeroline=False),
-            yaxis=dict(showgrid=False, showticklabels=False, zeroline=False)
-        )
-        return fig
+        """Get the empty chart with a message, building it on first use."""
+        if self._empty_fig is None:
+            self._empty_fig = self._create_message_chart("No steps to visualize", "gray")
+        return self._empty_fig
     
     def _create_error_chart(self):
-        """Create an error chart."""
+        """Get the error chart, building it on first use."""
+        if self._error_fig is None:
+            self._error_fig = self._create_message_chart("Error creating visualization", "red")
+        return self._error_fig
+    
+    def _create_message_chart(self, message: str, color: str):
+        """Create a blank chart showing a centered message."""
         fig = go.Figure()
         fig.add_annotation(
-            text="Error creating visualization",
+            text=message,
             xref="paper", yref="paper",
             x=0.5, y=0.5,
             showarrow=False,
-            font=dict(size=16, color="red")
+            font=dict(size=16, color=color)
         )
         fig.update_layout(
             height=300,
@@ -1,5 +1,6 @@
 import streamlit as st
 from typing import List, Dict
+from collections import Counter
 
 class StepVisualizer:
     """Handles the display of Chain of Thought reasoning steps in the Streamlit UI."""
@@ -57,10 +58,7 @@ class StepVisualizer:
         st.subheader("📋 Reasoning Summary")
         
         # Count step types
-        step_counts = {}
-        for step in steps:
-            step_type = step.get("type", "reasoning")
-            step_counts[step_type] = step_counts.get(step_type, 0) + 1
+        step_counts = Counter(step.get("type", "reasoning") for step in steps)
         
         # Display metrics
         cols = st.columns(len(step_counts))
@@ -84,19 +82,13 @@ class StepVisualizer:
             st.warning("No reasoning steps found.")
             return
         
+        # One markdown block for all steps, as every Streamlit element is a separate delta sent to the browser
+        entries = []
         for i, step in enumerate(steps):
-            step_type = step.get("type", "reasoning")
-            icon = self.step_icons.get(step_type, "💭")
-            content = step.get("content", "")
+            icon = self.step_icons.get(step.get("type", "reasoning"), "💭")
+            entries.append(f"**{icon}** **Step {i + 1}:** {step.get('content', '')}")
             
-            # Use columns for compact display
-            col1, col2 = st.columns([1, 8])
-            
-            with col1:
-                st.markdown(f"**{icon}**")
-            
-            with col2:
-                st.markdown(f"**Step {i + 1}:** {content}")
+        st.markdown("\n\n".join(entries))
     
     def display_timeline_steps(self, steps: List[Dict[str, str]]):
         """Display steps in a timeline format."""
@@ -106,24 +98,15 @@ class StepVisualizer:
         
         st.subheader("🕐 Reasoning Timeline")
         
+        # Timeline entries as rows of a single markdown table rather than columns per step
+        rows = ["| # | | Step |", "|---|---|---|"]
         for i, step in enumerate(steps):
-            step_type = step.get("type", "reasoning")
-            icon = self.step_icons.get(step_type, "💭")
-            content = step.get("content", "")
-            
-            # Timeline entry
-            with st.container():
-                col1, col2, col3 = st.columns([1, 1, 8])
-                
-                with col1:
-                    st.markdown(f"**{i + 1}**")
-                
-                with col2:
-                    st.markdown(f"{icon}")
-                
-                with col3:
-                    st.markdown(content)
-                
-                # Add connector line (except for last step)
-                if i < len(steps) - 1:
-                    st.markdown("&nbsp;&nbsp;&nbsp;|")
+            icon = self.step_icons.get(step.get("type", "reasoning"), "💭")
+            rows.append(f"| **{i + 1}** | {icon} | {self._table_cell(step.get('content', ''))} |")
+
+        st.markdown("\n".join(rows))
+
+    def _table_cell(self, text: str) -> str:
+        """Make text safe to place in a markdown table cell."""
+        # A table row has to stay on one line, and a bare pipe would start a new cell
+        return " ".join(text.split()).replace("|", "\\|")